@@ -3,15 +3,58 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
 import bcrypt
+import hashlib
+import time
 import os
 
+from .cache import TTLCache
+
 # Секретный ключ и алгоритм читаем из окружения
 SECRET_KEY = os.getenv("SECRET_KEY", "tourism-platform-secret-key-2024-production-ready")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Сколько минут удаленный пользователь числится отозванным: дольше его токены и так не живут
+REVOCATION_RETENTION_MINUTES = float(os.getenv("REVOCATION_RETENTION_MINUTES", str(ACCESS_TOKEN_EXPIRE_MINUTES)))
+
+# Кэш проверенных токенов: ключ — SHA-256 токена, значение — claims до истечения exp
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "1800"))
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+def decode_token(token: str) -> Optional[dict]:
+    """Проверяет JWT токен и возвращает его claims (с кэшированием до exp)"""
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    exp = payload.get("exp")
+    token_cache.set(key, payload, ttl=exp - time.time() if exp is not None else None)
+    return payload
+
+def decode_user_token(token: str) -> Optional[dict]:
+    """Claims пользовательского токена; токены без uid (старые и сервисные) не принимаются"""
+    payload = decode_token(token)
+    if payload is None or payload.get("sub") is None or payload.get("uid") is None:
+        return None
+    return payload
+
+def has_role(claims: dict, role: str) -> bool:
+    return role in claims.get("roles", ())
 
-# Список администраторов (в реальном приложении это должно быть в базе данных)
-ADMIN_USERS = ['admin', 'manager', 'root', 'boss']
+# Администраторы (в реальном приложении это должно быть в базе данных). Роли попадают в токен
+# при входе, остальные сервисы проверяют их по claims
+ADMIN_USERS = [
+    name.strip()
+    for name in os.getenv("ADMIN_USERS", "admin,manager,root,boss").split(",")
+    if name.strip()
+]
+
+def user_roles(username: str) -> list:
+    return ["user", "admin"] if username in ADMIN_USERS else ["user"]
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -24,19 +67,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def hash_password(plain_password: str) -> str:
+    return bcrypt.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def verify_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        return username
-    except JWTError:
+    payload = decode_user_token(token)
+    if payload is None:
         return None
-
-def is_admin_user(username: str) -> bool:
-    """Проверяет, является ли пользователь администратором"""
-    return username in ADMIN_USERS
\ No newline at end of file
+    return payload.get("sub")
\ No newline at end of file
@@ -0,0 +1,68 @@
+# deadline.py — бюджет времени запроса (одинаковый модуль во всех сервисах)
+from contextvars import ContextVar
+from typing import Optional
+import json
+import math
+import os
+import time
+
+# Оставшийся бюджет в миллисекундах; каждый сервис уменьшает его перед вызовом соседа.
+# Передается относительное значение, а не абсолютное время — часы узлов могут расходиться
+BUDGET_HEADER = "X-Request-Budget-Ms"
+# Бюджет запроса, если вызывающий его не передал (и верхняя граница для переданного)
+REQUEST_BUDGET_MS = float(os.getenv("REQUEST_BUDGET_MS", "10000"))
+
+# Момент (time.monotonic), к которому запрос должен быть обработан
+deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+def remaining() -> Optional[float]:
+    """Сколько секунд осталось до дедлайна текущего запроса (None — вне запроса)"""
+    deadline = deadline_var.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def budget_header_value() -> Optional[str]:
+    left = remaining()
+    if left is None:
+        return None
+    return str(max(int(left * 1000), 0))
+
+class DeadlineMiddleware:
+    """Чистый ASGI middleware: ставит дедлайн по X-Request-Budget-Ms; истекший бюджет — сразу 504"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget_ms = REQUEST_BUDGET_MS
+        for name, value in scope["headers"]:
+            if name == b"x-request-budget-ms":
+                try:
+                    parsed = float(value)
+                except ValueError:
+                    break
+                if math.isfinite(parsed):
+                    budget_ms = min(parsed, REQUEST_BUDGET_MS)
+                break
+
+        if budget_ms <= 0:
+            # Вызывающий уже не дождется ответа — не тратим на запрос ни БД, ни соседей
+            body = json.dumps({"detail": "Request deadline exceeded"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 504,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        token = deadline_var.set(time.monotonic() + budget_ms / 1000)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            deadline_var.reset(token)
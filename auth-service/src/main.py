@@ -1,23 +1,38 @@
 # auth-service/src/main.py
 import time
+import logging
+import os
 from datetime import datetime
-from sqlalchemy import text
-from fastapi import FastAPI, Depends, HTTPException, status
+from sqlalchemy import text, any_, literal, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from typing import List
-import bcrypt
-from jose import JWTError, jwt
+from typing import List, Optional
 
-from . import models, schemas, auth_utils
-from .database import SessionLocal, engine, get_db
+from . import models, schemas, auth_utils, password_pool, refresh_tokens, revocation
+from .cache import TTLCache
+from .pagination import paginate, finish_page
+from .metrics import MetricsMiddleware, ServiceCollector, register_collector, metrics_response
+from .logging_config import setup_logging, RequestIdMiddleware
+from .tracing import setup_tracing, instrument_engine, TracingMiddleware
+from .deadline import DeadlineMiddleware
+from .database import (
+    SessionLocal, engine, get_db, run_db, shutdown_db_executor,
+    db_state, refresh_db_status, start_db_monitor, stop_db_monitor,
+)
 from sqlalchemy.exc import SQLAlchemyError
 
+setup_logging("auth-service")
+setup_tracing("auth-service")
+instrument_engine(engine)
+logger = logging.getLogger(__name__)
+
 # Создаем таблицы в БД (если БД недоступна — не падаем)
 try:
     models.Base.metadata.create_all(bind=engine)
 except SQLAlchemyError as e:
-    print(f"Связь с БД разорвана при инициализации таблиц: {e}")
+    logger.error("Связь с БД разорвана при инициализации таблиц: %s", e)
 
 app = FastAPI(
     title="Auth Service",
@@ -27,65 +42,113 @@ app = FastAPI(
 
 security = HTTPBearer()
 
+# Кэш текущего пользователя по username: избавляет от запроса к БД при каждой авторизации.
+# Удаленного на другой реплике пользователя отсюда убирает синхронизация списка отозванных
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+def evict_revoked_users(user_ids: frozenset):
+    user_cache.pop_matching(lambda user: user.id in user_ids)
+
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(TracingMiddleware)
+register_collector(ServiceCollector(
+    engine,
+    caches={"token": auth_utils.token_cache, "user": user_cache},
+    stats={"password_pool": lambda: password_pool.pool_stats},
+))
+
+@app.on_event("startup")
+async def startup():
+    start_db_monitor()
+    password_pool.start_password_pool()
+    refresh_tokens.start_purge_task()
+    revocation.start_revocation_poller(evict_revoked_users)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_db_monitor()
+    await refresh_tokens.stop_purge_task()
+    await revocation.stop_revocation_poller()
+    shutdown_db_executor()
+    password_pool.shutdown_password_pool()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+# Claims пользовательского токена (sub, uid, roles)
+async def get_token_claims(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> dict:
+    claims = auth_utils.decode_user_token(credentials.credentials)
+    if claims is None:
+        raise credentials_exception
+    return claims
+
 # Функция для получения текущего пользователя из токена
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    claims: dict = Depends(get_token_claims),
     db: Session = Depends(get_db)
 ):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    try:
-        payload = jwt.decode(credentials.credentials, auth_utils.SECRET_KEY, algorithms=[auth_utils.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+    username = claims["sub"]
+    if revocation.is_revoked(claims["uid"]):
+        user_cache.pop(username)
         raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = user_cache.get(username)
     if user is None:
+        db_user = await run_db(db.query(models.User).filter(models.User.username == username).first)
+        if db_user is None:
+            raise credentials_exception
+        # Кэшируем снимок данных, а не ORM-объект, привязанный к сессии
+        user = schemas.UserResponse.model_validate(db_user)
+        user_cache.set(username, user)
+    # Имя удаленного пользователя могли занять заново — старый токен к новой учетной записи не подходит
+    if user.id != claims["uid"]:
         raise credentials_exception
     return user
 
-
-
-
 @app.get("/health")
 async def health_check():
-    try:
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        db_status = "connected"
-    except Exception:
-        db_status = "disconnected"
+    db_status = db_state["status"]
+    if db_status == "unknown":
+        # Монитор еще не успел отработать — проверяем один раз сами
+        db_status = await refresh_db_status()
     
     return {
         "status": "healthy" if db_status == "connected" else "unhealthy",
         "service": "auth-service",  
         "database": db_status,
+        "password_pool": password_pool.pool_stats,
+        "token_cache": auth_utils.token_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "revocation": revocation.revocation_stats,
         "timestamp": datetime.utcnow().isoformat()
     }
 
-
-
-
-
 # Регистрация (остается публичной)
 @app.post("/users", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
 async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(
+    existing_user = await run_db(db.query(models.User).filter(
         (models.User.username == user.username) | 
         (models.User.email == user.email)
-    ).first()
+    ).first)
     
     if existing_user:
         raise HTTPException(status_code=400, detail="Username or email already exists")
     
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    # Возвращаем соединение в пул до bcrypt: очередь хеширования длиннее пула соединений
+    await run_db(db.rollback)
+    hashed_password = await password_pool.hash_password(user.password)
     
     db_user = models.User(
         username=user.username,
@@ -96,63 +159,114 @@ async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await run_db(db.commit)
     return db_user
 
+def create_user_access_token(user: models.User) -> str:
+    # id и роли в claims позволяют другим сервисам не обращаться к auth-service
+    return auth_utils.create_access_token(data={
+        "sub": user.username,
+        "uid": user.id,
+        "roles": auth_utils.user_roles(user.username),
+    })
+
 # ЛОГИН - получение JWT токена
 @app.post("/login", response_model=schemas.Token)
 async def login(user_data: schemas.UserLogin, db: Session = Depends(get_db)):
     # Находим пользователя
-    user = db.query(models.User).filter(models.User.username == user_data.username).first()
-    if not user or not auth_utils.verify_password(user_data.password, user.password_hash):
+    user = await run_db(db.query(models.User).filter(models.User.username == user_data.username).first)
+    # Возвращаем соединение в пул до bcrypt: очередь проверки длиннее пула соединений.
+    # Отсоединенный объект сохраняет загруженные атрибуты и не перечитывается после rollback
+    if user is not None:
+        db.expunge(user)
+    await run_db(db.rollback)
+    if not user or not await password_pool.verify_password(user_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
     
-    # Создаем JWT токен
-    access_token = auth_utils.create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Создаем JWT токен и refresh-токен, которым сессия продлевается без повторной проверки пароля
+    # (вставка идет в новой короткой транзакции)
+    access_token = create_user_access_token(user)
+    refresh_token = refresh_tokens.issue(db, user.id)
+    await run_db(db.commit)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+# Обновление сессии: refresh-токен меняется на новую пару (старый погашается)
+@app.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(request: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    try:
+        user, refresh_token = await run_db(refresh_tokens.rotate, db, request.refresh_token)
+    except refresh_tokens.InvalidRefreshToken:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+        )
+    access_token = create_user_access_token(user)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+# Выход: отзывает все refresh-токены этого входа
+@app.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(request: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    await run_db(refresh_tokens.revoke, db, request.refresh_token)
 
 # 🔧 ИСПРАВЛЕННЫЙ ПОРЯДОК - /users/me ДО /users/{user_id}
 # Получить данные текущего пользователя
 @app.get("/users/me", response_model=schemas.UserResponse)
-async def read_users_me(current_user: models.User = Depends(get_current_user)):
+async def read_users_me(current_user: schemas.UserResponse = Depends(get_current_user)):
     return current_user
 
 # Получить пользователя по ID (требует авторизации)
 @app.get("/users/{user_id}", response_model=schemas.UserResponse)
 async def get_user(
     user_id: int, 
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await run_db(db.query(models.User).filter(models.User.id == user_id).first)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+# Пакетно получить пользователей по списку id (требует авторизации)
+@app.post("/users/batch", response_model=List[schemas.UserResponse])
+async def get_users_batch(
+    batch: schemas.UserBatchRequest,
+    current_user: schemas.UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Один запрос WHERE id = ANY(:ids) вместо N вызовов /users/{id}; отсутствующие id просто не попадут в ответ
+    user_ids = list(dict.fromkeys(batch.ids))
+    id_array = literal(user_ids, ARRAY(Integer))
+    users = await run_db(
+        db.query(models.User).filter(models.User.id == any_(id_array)).order_by(models.User.id).all
+    )
+    return users
+
 # Получить всех пользователей (требует авторизации)
 @app.get("/users", response_model=List[schemas.UserResponse])
 async def get_users(
-    skip: int = 0, 
-    limit: int = 100, 
-    current_user: models.User = Depends(get_current_user),
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor"),
+    current_user: schemas.UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+    users = await run_db(paginate(db.query(models.User), models.User.id, cursor, skip, limit).all)
+    return finish_page(users, limit, response)
 
 # Удалить пользователя (только для администраторов)
 @app.delete("/users/{user_id}")
 async def delete_user(
     user_id: int,
-    current_user: models.User = Depends(get_current_user),
+    claims: dict = Depends(get_token_claims),
+    current_user: schemas.UserResponse = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     # Проверяем права администратора
-    if not auth_utils.is_admin_user(current_user.username):
+    if not auth_utils.has_role(claims, "admin"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
@@ -166,16 +280,34 @@ async def delete_user(
         )
     
     # Находим пользователя для удаления
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await run_db(db.query(models.User).filter(models.User.id == user_id).first)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Удаляем пользователя
-    db.delete(user)
-    db.commit()
+    # Удаляем пользователя и в той же транзакции отзываем его токены
+    username = user.username
+    await run_db(db.delete, user)
+    await run_db(refresh_tokens.delete_for_user, db, user_id)
+    db.add(models.RevokedUser(user_id=user_id))
+    await run_db(db.commit)
+    revocation.mark_revoked(user_id)
+    user_cache.pop(username)
     
     return {"message": "User deleted successfully"}
 
+# Отозванные пользователи — их опрашивают tours-service и booking-service (нужен сервисный токен)
+@app.get("/internal/revoked-users", response_model=schemas.RevokedUsers)
+async def get_revoked_users(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    claims = auth_utils.decode_token(credentials.credentials)
+    if claims is None or not auth_utils.has_role(claims, "service"):
+        raise credentials_exception
+    
+    user_ids = await run_db(revocation.load_revoked, db)
+    return {"user_ids": user_ids}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
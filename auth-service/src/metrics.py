@@ -0,0 +1,93 @@
+# metrics.py — метрики Prometheus (одинаковый модуль во всех сервисах)
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from fastapi import Response
+from typing import Callable, Dict
+import time
+
+# Границы корзин гистограммы задержек (секунды): от 5 мс до 10 с
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_COUNT = Counter(
+    "http_requests_total", "HTTP requests by route template and status",
+    ["method", "route", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route"], buckets=LATENCY_BUCKETS,
+)
+
+class MetricsMiddleware:
+    """Чистый ASGI middleware: время ответа и счетчик запросов по шаблону маршрута.
+
+    Метка route — шаблон вида /bookings/{booking_id}, а не сам путь, чтобы число рядов не росло.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # FastAPI кладет найденный маршрут в scope при маршрутизации
+            route = scope.get("route")
+            template = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            REQUEST_LATENCY.labels(method, template).observe(time.perf_counter() - started)
+            REQUEST_COUNT.labels(method, template, str(status_code)).inc()
+
+class ServiceCollector:
+    """Снимает состояние пула БД, кэшей и прочих счетчиков в момент запроса /metrics"""
+
+    def __init__(self, engine, caches: Dict[str, object] = None, stats: Dict[str, Callable[[], dict]] = None):
+        self.engine = engine
+        self.caches = caches or {}
+        self.stats = stats or {}
+
+    def collect(self):
+        pool = self.engine.pool
+        yield GaugeMetricFamily("db_pool_size", "Configured DB connection pool size", value=pool.size())
+        yield GaugeMetricFamily("db_pool_checked_out", "DB connections currently in use", value=pool.checkedout())
+        # QueuePool ведет overflow от -pool_size: отрицательное значение — пул еще не заполнен
+        yield GaugeMetricFamily("db_pool_overflow", "DB connections opened above pool_size", value=max(pool.overflow(), 0))
+        yield GaugeMetricFamily("db_pool_connections", "DB connections currently open",
+                                value=pool.checkedin() + pool.checkedout())
+
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        size = GaugeMetricFamily("cache_size", "Entries currently cached", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Cache hit ratio since start", labels=["cache"])
+        for name, cache in self.caches.items():
+            cache_stats = cache.stats()
+            hits.add_metric([name], cache_stats["hits"])
+            misses.add_metric([name], cache_stats["misses"])
+            size.add_metric([name], cache_stats["size"])
+            ratio.add_metric([name], cache_stats["hit_ratio"])
+        if self.caches:
+            yield from (hits, misses, size, ratio)
+
+        # Числовые значения из произвольных словарей статистики: <источник>_<ключ>
+        for source, get_stats in self.stats.items():
+            for key, value in get_stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield GaugeMetricFamily(f"{source}_{key}", f"{source} {key}", value=value)
+
+def register_collector(collector: ServiceCollector):
+    REGISTRY.register(collector)
+
+def metrics_response() -> Response:
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
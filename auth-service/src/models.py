@@ -1,10 +1,13 @@
 
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary
+from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from .database import Base
 
 class User(Base):
     __tablename__ = "users"
+    # Серверные значения (id, created_at) возвращаются тем же INSERT ... RETURNING
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, index=True, nullable=False)
@@ -12,4 +15,21 @@ class User(Base):
     email = Column(String(100), unique=True, index=True, nullable=False)
     name = Column(String(100), nullable=False)
     phone = Column(String(20))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class RevokedUser(Base):
+    """Удаленные пользователи, чьи выданные токены больше не принимаются"""
+    __tablename__ = "revoked_users"
+
+    user_id = Column(Integer, primary_key=True)
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+class RefreshToken(Base):
+    """Refresh-токены: хранится только хеш, токены одного входа образуют цепочку (family_id)"""
+    __tablename__ = "refresh_tokens"
+
+    token_hash = Column(LargeBinary, primary_key=True)  # SHA-256 токена
+    family_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    revoked_at = Column(DateTime(timezone=True))
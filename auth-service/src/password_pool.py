@@ -0,0 +1,101 @@
+# auth-service/src/password_pool.py
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
+import multiprocessing
+import asyncio
+import time
+import os
+
+from . import auth_utils
+from .tracing import tracer, trace
+
+# Процессы для bcrypt (по умолчанию — по числу ядер). 0 — считать прямо в event loop
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+# Сколько запросов может ждать свободный процесс, прежде чем сервис начнет отвечать 503
+BCRYPT_MAX_QUEUE = int(os.getenv("BCRYPT_MAX_QUEUE", "100"))
+
+_executor = None
+_semaphore = None
+
+# Счетчики пула: текущая очередь, выполняющиеся задачи, максимум очереди, отказы
+pool_stats = {
+    "workers": BCRYPT_WORKERS,
+    "queued": 0,
+    "max_queued": 0,
+    "in_flight": 0,
+    "completed": 0,
+    "rejected": 0,
+}
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn вместо fork: процесс сервиса уже многопоточный (пул потоков БД)
+        _executor = ProcessPoolExecutor(
+            max_workers=BCRYPT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(BCRYPT_WORKERS)
+    return _semaphore
+
+def start_password_pool():
+    if BCRYPT_WORKERS > 0:
+        _get_executor()
+
+def shutdown_password_pool():
+    global _executor, _semaphore
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    _semaphore = None
+
+async def _run(func, *args):
+    # Спан покрывает и ожидание свободного процесса, и сам расчет bcrypt
+    with tracer.start_as_current_span(f"bcrypt {func.__name__}") as span:
+        span.set_attribute("bcrypt.workers", BCRYPT_WORKERS)
+        return await _run_in_pool(func, *args)
+
+async def _run_in_pool(func, *args):
+    if BCRYPT_WORKERS <= 0:
+        return func(*args)
+
+    if pool_stats["queued"] >= BCRYPT_MAX_QUEUE:
+        pool_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Password service is busy, try again later"
+        )
+
+    semaphore = _get_semaphore()
+    pool_stats["queued"] += 1
+    pool_stats["max_queued"] = max(pool_stats["max_queued"], pool_stats["queued"])
+    wait_started = time.perf_counter()
+    try:
+        await semaphore.acquire()
+    finally:
+        pool_stats["queued"] -= 1
+    trace.get_current_span().set_attribute(
+        "bcrypt.queue_wait_ms", round((time.perf_counter() - wait_started) * 1000, 3)
+    )
+
+    pool_stats["in_flight"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), func, *args)
+    finally:
+        pool_stats["in_flight"] -= 1
+        pool_stats["completed"] += 1
+        semaphore.release()
+
+async def hash_password(plain_password: str) -> str:
+    """Хеширует пароль в отдельном процессе"""
+    return await _run(auth_utils.hash_password, plain_password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Проверяет пароль в отдельном процессе"""
+    return await _run(auth_utils.verify_password, plain_password, hashed_password)
@@ -0,0 +1,138 @@
+# auth-service/src/refresh_tokens.py
+from sqlalchemy import update, func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from typing import Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+import uuid
+
+from .models import RefreshToken, RevokedUser, User
+from .auth_utils import REVOCATION_RETENTION_MINUTES
+from .database import SessionLocal, run_db
+
+logger = logging.getLogger(__name__)
+
+# Срок жизни refresh-токена (дни); каждое обновление выдает новый токен на тот же срок
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+# Период фоновой очистки просроченных refresh-токенов и старых записей об отзыве (секунды)
+REFRESH_TOKEN_PURGE_INTERVAL = float(os.getenv("REFRESH_TOKEN_PURGE_INTERVAL", "3600"))
+
+_purge_task = None
+
+class InvalidRefreshToken(Exception):
+    """Токен неизвестен, просрочен или отозван"""
+
+def token_digest(token: str) -> bytes:
+    # В БД хранится только 32-байтовый SHA-256: утечка таблицы не дает рабочих токенов
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+def issue(db: Session, user_id: int, family_id: uuid.UUID = None) -> str:
+    """Добавляет в текущую транзакцию новый токен; без family_id начинается новая цепочка (вход)"""
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        token_hash=token_digest(token),
+        family_id=family_id or uuid.uuid4(),
+        user_id=user_id,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+def rotate(db: Session, token: str) -> Tuple[User, str]:
+    """Погашает токен и выдает следующий в той же цепочке.
+
+    Погашение — один условный UPDATE, поэтому из двух параллельных обновлений одним
+    токеном пройдет только одно. Повторное предъявление погашенного токена означает,
+    что он украден (или уже использован): отзывается вся цепочка.
+    """
+    token_hash = token_digest(token)
+    used = db.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == token_hash,
+            RefreshToken.revoked_at.is_(None),
+            RefreshToken.expires_at > func.now(),
+        )
+        .values(revoked_at=func.now())
+        .returning(RefreshToken.user_id, RefreshToken.family_id)
+    ).first()
+    if used is None:
+        stored = db.get(RefreshToken, token_hash)
+        if stored is not None and stored.revoked_at is not None:
+            revoke_family(db, stored.family_id)
+            db.commit()
+            logger.warning("Повторное использование refresh-токена, цепочка отозвана",
+                           extra={"user_id": stored.user_id})
+        raise InvalidRefreshToken()
+
+    user = db.get(User, used.user_id)
+    if user is None:
+        db.rollback()
+        raise InvalidRefreshToken()
+    new_token = issue(db, used.user_id, used.family_id)
+    db.commit()
+    return user, new_token
+
+def revoke_family(db: Session, family_id: uuid.UUID):
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=func.now())
+    )
+
+def revoke(db: Session, token: str):
+    """Выход: отзывает цепочку, к которой относится токен (неизвестный токен — не ошибка)"""
+    stored = db.get(RefreshToken, token_digest(token))
+    if stored is not None:
+        revoke_family(db, stored.family_id)
+    db.commit()
+
+def delete_for_user(db: Session, user_id: int):
+    """Удаляет все refresh-токены пользователя в текущей транзакции"""
+    db.query(RefreshToken).filter(RefreshToken.user_id == user_id).delete(synchronize_session=False)
+
+def purge_expired() -> Tuple[int, int]:
+    # Погашенные, но не просроченные записи нужны для обнаружения повторного использования
+    db = SessionLocal()
+    try:
+        deleted = db.query(RefreshToken).filter(RefreshToken.expires_at <= func.now()).delete(
+            synchronize_session=False
+        )
+        # Отозванный пользователь дольше срока жизни access-токена в списке не нужен
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=REVOCATION_RETENTION_MINUTES)
+        revoked = db.query(RevokedUser).filter(RevokedUser.revoked_at <= cutoff).delete(
+            synchronize_session=False
+        )
+        db.commit()
+        return deleted, revoked
+    finally:
+        db.close()
+
+async def _purge_loop():
+    while True:
+        await asyncio.sleep(REFRESH_TOKEN_PURGE_INTERVAL)
+        try:
+            deleted, revoked = await run_db(purge_expired)
+            if deleted or revoked:
+                logger.info("Удалены просроченные refresh-токены и записи об отзыве",
+                            extra={"deleted": deleted, "revoked_users": revoked})
+        except Exception:
+            logger.exception("Ошибка очистки refresh-токенов")
+
+def start_purge_task():
+    global _purge_task
+    if _purge_task is None:
+        _purge_task = asyncio.create_task(_purge_loop())
+
+async def stop_purge_task():
+    global _purge_task
+    if _purge_task is not None:
+        _purge_task.cancel()
+        try:
+            await _purge_task
+        except asyncio.CancelledError:
+            pass
+        _purge_task = None
@@ -0,0 +1,87 @@
+# auth-service/src/revocation.py — локальный список отозванных пользователей (читается из БД;
+# tours-service и booking-service получают его через GET /internal/revoked-users)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+import asyncio
+import logging
+import os
+import time
+
+from .auth_utils import REVOCATION_RETENTION_MINUTES
+from .database import SessionLocal, run_db
+from .models import RevokedUser
+
+logger = logging.getLogger(__name__)
+
+# Период синхронизации (секунды): столько другие реплики auth-service могут отдавать удаленного
+# пользователя из своего user_cache
+REVOCATION_POLL_INTERVAL = float(os.getenv("REVOCATION_POLL_INTERVAL", "10"))
+
+# Множество заменяется целиком при каждой синхронизации, поэтому проверка идет без блокировок
+revoked_user_ids = frozenset()
+revocation_stats = {"revoked_users": 0, "syncs": 0, "sync_errors": 0, "last_sync_timestamp": 0.0}
+
+_poll_task = None
+
+def is_revoked(user_id: int) -> bool:
+    return user_id in revoked_user_ids
+
+def load_revoked(db: Session) -> list:
+    # Только чтение: старые записи удаляет фоновая очистка (refresh_tokens.purge_expired).
+    # Записи старше срока жизни токена не нужны: токенов удаленного пользователя уже не осталось
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=REVOCATION_RETENTION_MINUTES)
+    rows = (
+        db.query(RevokedUser.user_id)
+        .filter(RevokedUser.revoked_at > cutoff)
+        .order_by(RevokedUser.user_id)
+        .all()
+    )
+    return [row.user_id for row in rows]
+
+def _load_with_own_session() -> list:
+    db = SessionLocal()
+    try:
+        return load_revoked(db)
+    finally:
+        db.close()
+
+def mark_revoked(user_id: int):
+    """Удаление на этой реплике учитывается сразу, не дожидаясь синхронизации"""
+    global revoked_user_ids
+    revoked_user_ids = revoked_user_ids | {user_id}
+
+async def sync_revoked_users(on_revoked: Optional[Callable[[frozenset], None]] = None):
+    global revoked_user_ids
+    revoked_user_ids = frozenset(await run_db(_load_with_own_session))
+    revocation_stats["revoked_users"] = len(revoked_user_ids)
+    revocation_stats["syncs"] += 1
+    revocation_stats["last_sync_timestamp"] = time.time()
+    if on_revoked is not None and revoked_user_ids:
+        on_revoked(revoked_user_ids)
+
+async def _poll_loop(on_revoked: Optional[Callable[[frozenset], None]]):
+    while True:
+        try:
+            await sync_revoked_users(on_revoked)
+        except SQLAlchemyError as e:
+            revocation_stats["sync_errors"] += 1
+            logger.warning("Не удалось обновить список отозванных пользователей: %s", e)
+        await asyncio.sleep(REVOCATION_POLL_INTERVAL)
+
+def start_revocation_poller(on_revoked: Optional[Callable[[frozenset], None]] = None):
+    """on_revoked получает актуальное множество id после каждой синхронизации"""
+    global _poll_task
+    if _poll_task is None:
+        _poll_task = asyncio.create_task(_poll_loop(on_revoked))
+
+async def stop_revocation_poller():
+    global _poll_task
+    if _poll_task is not None:
+        _poll_task.cancel()
+        try:
+            await _poll_task
+        except asyncio.CancelledError:
+            pass
+        _poll_task = None
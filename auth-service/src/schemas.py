@@ -1,8 +1,10 @@
 # auth-service/src/schemas.py
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, computed_field
+from typing import List, Optional
 from datetime import datetime
 
+from .auth_utils import user_roles
+
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -18,6 +20,12 @@ class UserResponse(BaseModel):
     phone: Optional[str]
     created_at: datetime
 
+    # Те же роли, что попадают в токен: по ним интерфейс показывает администраторов
+    @computed_field
+    @property
+    def roles(self) -> List[str]:
+        return user_roles(self.username)
+
     class Config:
         from_attributes = True
 
@@ -28,6 +36,16 @@ class UserLogin(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str = Field(..., min_length=1, max_length=256)
 
 class TokenData(BaseModel):
-    username: Optional[str] = None
\ No newline at end of file
+    username: Optional[str] = None
+
+class RevokedUsers(BaseModel):
+    user_ids: List[int]
+
+class UserBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=500)
\ No newline at end of file
@@ -18,3 +18,228 @@ def test_health_endpoint_returns_ok():
     assert body.get("status") in {"healthy", "unhealthy"}
 
 
+def test_get_db_fails_fast_when_db_marked_disconnected():
+    import pytest
+    from fastapi import HTTPException
+    from src import database
+
+    previous = database.db_state["status"]
+    database.db_state["status"] = "disconnected"
+    try:
+        with pytest.raises(HTTPException) as exc:
+            next(database.get_db())
+        assert exc.value.status_code == 503
+    finally:
+        database.db_state["status"] = previous
+
+
+def test_password_pool_hashes_and_verifies():
+    import asyncio
+    from src import password_pool
+
+    async def scenario():
+        hashed = await password_pool.hash_password("secret")
+        return (
+            await password_pool.verify_password("secret", hashed),
+            await password_pool.verify_password("wrong", hashed),
+        )
+
+    try:
+        assert asyncio.run(scenario()) == (True, False)
+        assert password_pool.pool_stats["queued"] == 0
+    finally:
+        password_pool.shutdown_password_pool()
+
+
+def test_users_me_served_from_user_cache(make_token):
+    from datetime import datetime
+    from src import schemas
+    from src.main import user_cache
+
+    user_cache.set("cached", schemas.UserResponse(
+        id=7, username="cached", email="c@example.com", name="Cached",
+        phone=None, created_at=datetime.utcnow(),
+    ))
+    try:
+        token = make_token("cached", 7)
+        response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        assert response.json()["id"] == 7
+    finally:
+        user_cache.pop("cached")
+
+
+def test_users_batch_runs_single_query(fake_db, make_token):
+    from datetime import datetime
+    from types import SimpleNamespace
+    from src import schemas
+    from src.main import user_cache
+
+    fake_db.query_results = [[SimpleNamespace(
+        id=i, username=f"user{i}", email=f"u{i}@example.com", name="User",
+        phone=None, created_at=datetime.utcnow(),
+    ) for i in (1, 2)]]
+    user_cache.set("batcher", schemas.UserResponse(
+        id=9, username="batcher", email="b@example.com", name="Batcher",
+        phone=None, created_at=datetime.utcnow(),
+    ))
+    try:
+        token = make_token("batcher", 9)
+        response = client.post(
+            "/users/batch", json={"ids": [1, 2, 2, 404]},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 200
+        assert [u["id"] for u in response.json()] == [1, 2]
+        assert [u["roles"] for u in response.json()] == [["user"], ["user"]]
+        assert len(fake_db.queries) == 1
+        assert client.post(
+            "/users/batch", json={"ids": []}, headers={"Authorization": f"Bearer {token}"},
+        ).status_code == 422
+    finally:
+        user_cache.pop("batcher")
+
+
+def test_token_carries_uid_and_roles_and_internal_route_needs_service_role():
+    from jose import jwt
+    from src import auth_utils
+
+    token = auth_utils.create_access_token({"sub": "admin", "uid": 3, "roles": auth_utils.user_roles("admin")})
+    claims = jwt.decode(token, auth_utils.SECRET_KEY, algorithms=[auth_utils.ALGORITHM])
+    assert (claims["uid"], claims["roles"]) == (3, ["user", "admin"])
+    assert auth_utils.user_roles("alice") == ["user"]
+
+    # Пользовательский токен, даже администратора, не открывает внутренний список отозванных
+    response = client.get("/internal/revoked-users", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+    # Токен без uid не принимается обычными маршрутами
+    legacy = auth_utils.create_access_token({"sub": "admin"})
+    assert client.get("/users/me", headers={"Authorization": f"Bearer {legacy}"}).status_code == 401
+
+
+def test_revoked_users_endpoint_is_read_only(fake_db, make_token):
+    from types import SimpleNamespace
+
+    service = make_token("booking-service", roles=["service"])
+    fake_db.query_results = [[SimpleNamespace(user_id=4), SimpleNamespace(user_id=8)]]
+    response = client.get("/internal/revoked-users", headers={"Authorization": f"Bearer {service}"})
+    assert response.status_code == 200
+    assert response.json() == {"user_ids": [4, 8]}
+    # Старые записи чистит фоновая задача, опрос ничего не пишет
+    assert fake_db.commits == 0 and fake_db.deleted == []
+
+
+def test_refresh_rotates_token_and_reuse_revokes_family(fake_db):
+    import uuid
+    from datetime import datetime
+    from types import SimpleNamespace
+    from jose import jwt
+    from src import auth_utils, models, refresh_tokens
+
+    family = uuid.uuid4()
+    old, live = refresh_tokens.token_digest("old"), refresh_tokens.token_digest("live")
+    # "old" уже погашен, "live" действителен
+    fake_db.objects = {
+        (models.User, 4): SimpleNamespace(id=4, username="admin"),
+        (models.RefreshToken, old): SimpleNamespace(revoked_at=datetime.utcnow(), family_id=family, user_id=4),
+        (models.RefreshToken, live): SimpleNamespace(revoked_at=None, family_id=family, user_id=4),
+    }
+
+    def redeem(statement, params):
+        # Условный UPDATE проходит только для действительного токена
+        stored = fake_db.objects.get((models.RefreshToken, statement.compile().params.get("token_hash_1")))
+        return [SimpleNamespace(user_id=4, family_id=family)] if stored is not None and stored.revoked_at is None else []
+
+    fake_db.execute_results = [redeem] * 4
+    response = client.post("/token/refresh", json={"refresh_token": "live"})
+    assert response.status_code == 200
+    body = response.json()
+    claims = jwt.decode(body["access_token"], auth_utils.SECRET_KEY, algorithms=[auth_utils.ALGORITHM])
+    assert (claims["sub"], claims["uid"], claims["roles"]) == ("admin", 4, ["user", "admin"])
+    # Новый токен продолжает ту же цепочку, в БД — только его SHA-256
+    assert body["refresh_token"] not in ("live", None)
+    assert fake_db.added[0].family_id == family
+    assert fake_db.added[0].token_hash == refresh_tokens.token_digest(body["refresh_token"])
+    assert len(fake_db.statements) == 1
+
+    # Повтор погашенного токена: 401 и отзыв всей цепочки
+    assert client.post("/token/refresh", json={"refresh_token": "old"}).status_code == 401
+    assert fake_db.statements[-1].compile().params == {"family_id_1": family}
+    assert client.post("/token/refresh", json={"refresh_token": "unknown"}).status_code == 401
+
+
+def test_revoked_user_is_evicted_from_user_cache(monkeypatch, make_token):
+    from datetime import datetime
+    from src import revocation, schemas
+    from src.main import evict_revoked_users, user_cache
+
+    for user_id, username in ((11, "gone"), (12, "stays")):
+        user_cache.set(username, schemas.UserResponse(
+            id=user_id, username=username, email=f"{username}@example.com", name="User",
+            phone=None, created_at=datetime.utcnow(),
+        ))
+    try:
+        # Пользователя удалили на другой реплике: синхронизация убирает его из кэша по id
+        evict_revoked_users(frozenset({11}))
+        assert user_cache.get("gone") is None
+        assert user_cache.get("stays").id == 12
+
+        # До синхронизации кэша токен отозванного пользователя отклоняется по списку
+        monkeypatch.setattr(revocation, "revoked_user_ids", frozenset({12}))
+        token = make_token("stays", 12)
+        response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 401
+        assert user_cache.get("stays") is None
+    finally:
+        user_cache.pop("gone")
+        user_cache.pop("stays")
+
+
+def test_login_and_register_release_db_connection_before_bcrypt(fake_db, monkeypatch):
+    from datetime import datetime
+    from types import SimpleNamespace
+    from src import models, password_pool
+
+    rollbacks_at_bcrypt = []
+
+    async def fake_bcrypt(*args):
+        rollbacks_at_bcrypt.append(fake_db.rollbacks)
+        return "hash" if len(args) == 1 else True
+
+    monkeypatch.setattr(password_pool, "verify_password", fake_bcrypt)
+    monkeypatch.setattr(password_pool, "hash_password", fake_bcrypt)
+
+    def server_defaults(obj):
+        if isinstance(obj, models.User):
+            obj.id, obj.created_at = 4, datetime.utcnow()
+
+    fake_db.on_flush = server_defaults
+    fake_db.query_results = [[SimpleNamespace(id=3, username="alice", password_hash="hash")], []]
+
+    login = client.post("/login", json={"username": "alice", "password": "secret"})
+    register = client.post("/users", json={
+        "username": "bob", "password": "secret", "email": "b@example.com", "name": "Bob",
+    })
+    assert login.status_code == 200
+    assert register.status_code == 201
+    # Транзакция после SELECT закрыта до ожидания bcrypt, запись идет в новой
+    assert rollbacks_at_bcrypt == [1, 2]
+    assert fake_db.commits == 2
+
+
+def test_users_list_rejects_out_of_range_limit(make_token):
+    from datetime import datetime
+    from src import schemas
+    from src.main import user_cache
+
+    user_cache.set("lister", schemas.UserResponse(
+        id=13, username="lister", email="l@example.com", name="Lister",
+        phone=None, created_at=datetime.utcnow(),
+    ))
+    try:
+        token = make_token("lister", 13)
+        headers = {"Authorization": f"Bearer {token}"}
+        for params in ({"limit": 0}, {"limit": -5}, {"skip": -1}):
+            assert client.get("/users", params=params, headers=headers).status_code == 422
+    finally:
+        user_cache.pop("lister")
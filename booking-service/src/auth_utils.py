@@ -1,60 +1,152 @@
 # booking-service/src/auth_utils.py
 from jose import JWTError, jwt
+from datetime import datetime, timedelta
+from typing import Optional
 from fastapi import HTTPException, status
+import hashlib
+import logging
+import time
 import os
 import httpx
 
+from .cache import TTLCache
+from .http_clients import auth_client
+from .logging_config import debug_sampled
+
+logger = logging.getLogger(__name__)
+
 # Секретный ключ и алгоритм читаем из окружения (должны совпадать с auth-service)
 SECRET_KEY = os.getenv("SECRET_KEY", "tourism-platform-secret-key-2024-production-ready")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+SERVICE_TOKEN_EXPIRE_MINUTES = 5
 
-def verify_token(token: str):
-    """Проверяет JWT токен и возвращает username"""
+# Кэш проверенных токенов: ключ — SHA-256 токена, значение — claims до истечения exp
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "1800"))
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+def decode_token(token: str) -> Optional[dict]:
+    """Проверяет JWT токен и возвращает его claims (с кэшированием до exp)"""
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        return username
     except JWTError:
         return None
+    exp = payload.get("exp")
+    token_cache.set(key, payload, ttl=exp - time.time() if exp is not None else None)
+    return payload
+
+def decode_user_token(token: str) -> Optional[dict]:
+    """Claims пользовательского токена; токены без uid (старые и сервисные) не принимаются"""
+    payload = decode_token(token)
+    if payload is None or payload.get("sub") is None or payload.get("uid") is None:
+        return None
+    return payload
+
+def has_role(claims: dict, role: str) -> bool:
+    return role in claims.get("roles", ())
+
+def create_service_token(service: str) -> str:
+    """Короткоживущий токен с ролью service для внутренних эндпоинтов auth-service"""
+    expire = datetime.utcnow() + timedelta(minutes=SERVICE_TOKEN_EXPIRE_MINUTES)
+    return jwt.encode({"sub": service, "roles": ["service"], "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+
+def verify_token(token: str):
+    """Проверяет JWT токен и возвращает username"""
+    payload = decode_user_token(token)
+    if payload is None:
+        return None
+    return payload.get("sub")
 
 async def get_user_from_auth_service(user_id: int, token: str = None):
-    """Получает информацию о пользователе из auth-service"""
+    """Получает информацию о пользователе из auth-service (None — только если его нет, 404)"""
+    headers = {}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    
     try:
-        async with httpx.AsyncClient() as client:
-            # В Docker compose используем имя сервиса
-            auth_service_url = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8000")
-            headers = {}
-            if token:
-                headers["Authorization"] = f"Bearer {token}"
-            
-            url = f"{auth_service_url}/users/{user_id}"
-            print(f"Запрос к auth-service: {url}")
-            print(f"Заголовки: {headers}")
-            
-            response = await client.get(url, headers=headers)
-            print(f"Ответ от auth-service: {response.status_code}")
-            
-            if response.status_code == 200:
-                user_data = response.json()
-                print(f"Данные пользователя: {user_data}")
-                return user_data
-            else:
-                print(f"Ошибка от auth-service: {response.status_code} - {response.text}")
-                return None
-    except Exception as e:
-        print(f"Ошибка получения пользователя из auth-service: {e}")
+        response = await auth_client.get(f"/users/{user_id}", headers=headers)
+    except httpx.RequestError as e:
+        # Сюда же попадают разомкнутый автомат и исчерпанный дедлайн — быстрый 503
+        logger.warning("Ошибка подключения к auth-service: %s", e, extra={"user_id": user_id})
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Auth service unavailable"
+        )
+    debug_sampled(logger, "Ответ auth-service", extra={"user_id": user_id, "status": response.status_code})
+    
+    if response.status_code == 200:
+        return response.json()
+    if response.status_code == 404:
         return None
+    if response.status_code == status.HTTP_401_UNAUTHORIZED:
+        raise _rejected_by_auth_service()
+    logger.warning("Ошибка от auth-service", extra={"user_id": user_id, "status": response.status_code})
+    raise HTTPException(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        detail="Auth service error"
+    )
 
-async def validate_user_exists(user_id: int, token: str = None):
-    """Проверяет существование пользователя в auth-service"""
-    print(f"Проверяем существование пользователя {user_id} с токеном: {token[:20] if token else 'None'}...")
+def _rejected_by_auth_service() -> HTTPException:
+    # Токен подписан верно, но auth-service не признает его владельца (истек, отозван)
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def user_from_claims(claims: dict) -> dict:
+    # Подписанный и не отозванный токен сам подтверждает, что его владелец существует
+    return {"id": claims["uid"], "username": claims["sub"]}
+
+async def validate_user_exists(user_id: int, token: str = None, claims: dict = None):
+    """Проверяет существование пользователя (для владельца токена — без запроса к auth-service)"""
+    if claims is not None and claims["uid"] == user_id:
+        return user_from_claims(claims)
     user = await get_user_from_auth_service(user_id, token)
-    print(f"Результат проверки пользователя: {user}")
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     return user
+
+async def get_users_from_auth_service(user_ids, token: str, claims: dict = None) -> dict:
+    """Получает несколько пользователей из auth-service одним запросом POST /users/batch"""
+    users = {}
+    ids = list(dict.fromkeys(user_ids))
+    if claims is not None and claims["uid"] in ids:
+        users[claims["uid"]] = user_from_claims(claims)
+        ids.remove(claims["uid"])
+    if not ids:
+        return users
+    try:
+        # Пакетный запрос только читает данные — его можно повторять
+        response = await auth_client.post(
+            "/users/batch",
+            json={"ids": ids},
+            headers={"Authorization": f"Bearer {token}"},
+            idempotent=True,
+        )
+    except httpx.RequestError as e:
+        logger.warning("Ошибка подключения к auth-service: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Auth service unavailable"
+        )
+    # Коды ответа трактуются так же, как в get_user_from_auth_service
+    if response.status_code == status.HTTP_401_UNAUTHORIZED:
+        raise _rejected_by_auth_service()
+    if response.status_code == 404:
+        return users
+    if response.status_code != 200:
+        logger.warning("Ошибка от auth-service", extra={"status": response.status_code})
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Auth service error"
+        )
+    users.update((user["id"], user) for user in response.json())
+    return users
\ No newline at end of file
@@ -0,0 +1,251 @@
+# booking-service/src/http_clients.py
+from prometheus_client import Histogram
+import asyncio
+import httpx
+import logging
+import os
+import random
+import time
+
+from .metrics import LATENCY_BUCKETS
+from .logging_config import REQUEST_ID_HEADER, request_id_var
+from .tracing import tracer, inject_context, SpanKind
+from .deadline import BUDGET_HEADER, budget_header_value, remaining
+
+logger = logging.getLogger(__name__)
+
+# В Docker compose используем имена сервисов
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8000")
+TOURS_SERVICE_URL = os.getenv("TOURS_SERVICE_URL", "http://tours-service:8001")
+
+# Пул соединений и таймауты для вызовов соседних сервисов
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "2"))
+
+# Повторы идемпотентных запросов: число повторов и границы экспоненциальной паузы (full jitter)
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_RETRY_BASE_DELAY = float(os.getenv("HTTP_RETRY_BASE_DELAY", "0.05"))
+HTTP_RETRY_MAX_DELAY = float(os.getenv("HTTP_RETRY_MAX_DELAY", "1"))
+# Ответы, после которых повтор имеет смысл: сосед перегружен или перезапускается
+RETRY_STATUSES = {502, 503, 504}
+
+# Автомат: после BREAKER_FAILURE_THRESHOLD неудач подряд запросы к соседу не отправляются
+# BREAKER_RESET_TIMEOUT секунд, затем один пробный запрос решает, закрыть ли автомат
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "10"))
+
+# Задержка вызовов соседних сервисов; status — код ответа или "error" при сетевой ошибке
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to other services",
+    ["upstream", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+
+class CircuitOpenError(httpx.TransportError):
+    """Автомат разомкнут: сосед недавно не отвечал, запрос не отправлялся"""
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """Бюджет времени запроса исчерпан до вызова соседа"""
+
+class CircuitBreaker:
+    """Размыкается после серии неудач подряд; через reset_timeout пропускает один пробный запрос"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        # Одна проба за раз; проба, от которой нет ответа (например, отмененная), через
+        # reset_timeout считается потерянной
+        now = time.monotonic()
+        if state == "half_open" and (self._probe_started is None or now - self._probe_started >= self.reset_timeout):
+            self._probe_started = now
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probe_started is not None or self.failures >= self.failure_threshold:
+            # Неудачная проба снова размыкает автомат на полный reset_timeout
+            self.opened_at = time.monotonic()
+        self._probe_started = None
+
+def retry_delay(attempt: int) -> float:
+    """Full jitter: случайная пауза от 0 до экспоненциальной границы, чтобы повторы не шли волной"""
+    return random.uniform(0, min(HTTP_RETRY_MAX_DELAY, HTTP_RETRY_BASE_DELAY * 2 ** attempt))
+
+class UpstreamClient:
+    """Долгоживущий httpx-клиент к одному сервису с пулом keep-alive соединений"""
+
+    def __init__(self, name: str, base_url: str):
+        self.name = name
+        self.base_url = base_url
+        self._client = None
+        self.breaker = CircuitBreaker()
+        self.stats = {"requests": 0, "connections_opened": 0, "errors": 0, "retries": 0, "short_circuited": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            )
+        return self._client
+
+    async def _trace(self, event_name: str, info: dict):
+        # httpcore сообщает об открытии нового TCP-соединения; остальные запросы идут по keep-alive
+        if event_name == "connection.connect_tcp.complete":
+            self.stats["connections_opened"] += 1
+
+    async def request(self, method: str, path: str, idempotent: bool = None, **kwargs) -> httpx.Response:
+        """Запрос к соседу с учетом автомата, дедлайна и повторов.
+
+        Повторяются только идемпотентные запросы (по умолчанию GET) — при сетевой ошибке
+        или ответе 502/503/504, пока позволяет бюджет времени.
+        """
+        if idempotent is None:
+            idempotent = method == "GET"
+        retries = HTTP_RETRIES if idempotent else 0
+        attempt = 0
+        while True:
+            try:
+                response = await self._send(method, path, **kwargs)
+            except (CircuitOpenError, DeadlineExceeded):
+                raise
+            except httpx.RequestError:
+                if attempt >= retries or not await self._wait_before_retry(attempt):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                if not await self._wait_before_retry(attempt):
+                    return response
+                await response.aclose()
+            attempt += 1
+
+    async def _wait_before_retry(self, attempt: int) -> bool:
+        delay = retry_delay(attempt)
+        left = remaining()
+        if left is not None and left <= delay:
+            return False
+        self.stats["retries"] += 1
+        await asyncio.sleep(delay)
+        return True
+
+    def _timeout(self) -> httpx.Timeout:
+        # Ожидание соседа не дольше, чем осталось у самого запроса
+        left = remaining()
+        if left is None:
+            return httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        if left <= 0:
+            raise DeadlineExceeded(f"{self.name}: request deadline exceeded")
+        return httpx.Timeout(min(HTTP_TIMEOUT, left), connect=min(HTTP_CONNECT_TIMEOUT, left))
+
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        timeout = self._timeout()
+        if not self.breaker.allow():
+            self.stats["short_circuited"] += 1
+            raise CircuitOpenError(f"{self.name}: circuit open")
+        self.stats["requests"] += 1
+        # ID запроса передается дальше, чтобы логи всех сервисов связывались по нему
+        headers = {REQUEST_ID_HEADER: request_id_var.get(), **kwargs.pop("headers", {})}
+        budget = budget_header_value()
+        if budget is not None:
+            headers[BUDGET_HEADER] = budget
+        outcome = "error"
+        started = time.perf_counter()
+        with tracer.start_as_current_span(
+            f"{method} {self.name}",
+            kind=SpanKind.CLIENT,
+            attributes={"peer.service": self.name, "http.method": method, "http.target": path},
+        ) as span:
+            # traceparent: спан вызываемого сервиса станет дочерним для этого
+            inject_context(headers)
+            try:
+                response = await self.client.request(
+                    method, path, headers=headers, timeout=timeout,
+                    extensions={"trace": self._trace}, **kwargs
+                )
+                outcome = str(response.status_code)
+            except httpx.RequestError:
+                self.stats["errors"] += 1
+                self._record_failure()
+                raise
+            finally:
+                UPSTREAM_LATENCY.labels(self.name, method, outcome).observe(time.perf_counter() - started)
+            span.set_attribute("http.status_code", response.status_code)
+        # 5xx — сосед неисправен; 4xx — ответ по существу, автомат не размыкает
+        if response.status_code >= 500:
+            self._record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _record_failure(self):
+        was_open = self.breaker.opened_at is not None
+        self.breaker.record_failure()
+        if self.breaker.opened_at is not None and not was_open:
+            logger.warning("Автомат разомкнут", extra={"upstream": self.name, "failures": self.breaker.failures})
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def get_stats(self) -> dict:
+        requests = self.stats["requests"]
+        reused = max(requests - self.stats["connections_opened"], 0)
+        return {
+            **self.stats,
+            "connection_reuse_ratio": round(reused / requests, 4) if requests else 0.0,
+            "circuit_state": self.breaker.state,
+            "circuit_open": int(self.breaker.state == "open"),
+        }
+
+auth_client = UpstreamClient("auth-service", AUTH_SERVICE_URL)
+tours_client = UpstreamClient("tours-service", TOURS_SERVICE_URL)
+
+def start_clients():
+    """Создает клиентов при старте приложения, чтобы первый запрос не платил за это"""
+    auth_client.client
+    tours_client.client
+
+async def close_clients():
+    await auth_client.aclose()
+    await tours_client.aclose()
+
+def get_upstream_stats() -> dict:
+    return {c.name: c.get_stats() for c in (auth_client, tours_client)}
@@ -0,0 +1,94 @@
+# booking-service/src/idempotency.py
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import asyncio
+import hashlib
+import logging
+import os
+
+from .models import IdempotencyKey
+from .database import SessionLocal, run_db
+
+logger = logging.getLogger(__name__)
+
+# Сколько часов хранится ответ по ключу Idempotency-Key
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+# Период фоновой очистки просроченных ключей (секунды)
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+
+_purge_task = None
+
+class IdempotencyConflict(Exception):
+    """Ключ уже занят другим (параллельным) запросом, который успел зафиксировать ответ"""
+
+def key_digest(username: str, key: str) -> bytes:
+    # Ключи изолированы по пользователям; в БД хранится только 32-байтовый хеш
+    return hashlib.sha256(f"{username}\0{key}".encode("utf-8")).digest()
+
+def request_digest(payload: BaseModel) -> bytes:
+    return hashlib.sha256(payload.model_dump_json().encode("utf-8")).digest()
+
+def get_stored_response(db: Session, key_hash: bytes) -> Optional[IdempotencyKey]:
+    return db.query(IdempotencyKey).filter(
+        IdempotencyKey.key_hash == key_hash,
+        IdempotencyKey.expires_at > func.now(),
+    ).first()
+
+def save_response(db: Session, key_hash: bytes, request_hash: bytes, status_code: int, body: BaseModel):
+    """Сохраняет ответ в текущей транзакции; просроченную запись с тем же ключом перезаписывает"""
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)
+    values = {
+        "key_hash": key_hash,
+        "request_hash": request_hash,
+        "status_code": status_code,
+        "response": body.model_dump(mode="json"),
+        "expires_at": expires_at,
+    }
+    statement = insert(IdempotencyKey).values(**values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[IdempotencyKey.key_hash],
+        set_=values,
+        where=IdempotencyKey.expires_at <= func.now(),
+    )
+    if db.execute(statement).rowcount == 0:
+        raise IdempotencyConflict()
+
+def purge_expired() -> int:
+    db = SessionLocal()
+    try:
+        deleted = db.query(IdempotencyKey).filter(IdempotencyKey.expires_at <= func.now()).delete(
+            synchronize_session=False
+        )
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+async def _purge_loop():
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_PURGE_INTERVAL)
+        try:
+            deleted = await run_db(purge_expired)
+            if deleted:
+                logger.info("Удалены просроченные ключи идемпотентности", extra={"deleted": deleted})
+        except Exception:
+            logger.exception("Ошибка очистки ключей идемпотентности")
+
+def start_purge_task():
+    global _purge_task
+    if _purge_task is None:
+        _purge_task = asyncio.create_task(_purge_loop())
+
+async def stop_purge_task():
+    global _purge_task
+    if _purge_task is not None:
+        _purge_task.cancel()
+        try:
+            await _purge_task
+        except asyncio.CancelledError:
+            pass
+        _purge_task = None
@@ -0,0 +1,56 @@
+# booking-service/src/inventory.py
+from sqlalchemy import func, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from .models import TourDeparture
+
+class SeatsUnavailable(Exception):
+    """На дату отправления не хватает свободных мест"""
+
+def departure_date(travel_date: datetime) -> date:
+    # Дата отправления считается по UTC, чтобы одно и то же время не попадало в разные дни
+    if travel_date.tzinfo is not None:
+        travel_date = travel_date.astimezone(timezone.utc)
+    return travel_date.date()
+
+def reserve_seats(db: Session, tour_id: int, travel_date: datetime, seats: int, capacity: Optional[int]):
+    """Резервирует места одним условным upsert в текущей транзакции.
+
+    Строка даты блокируется до commit, поэтому вызывать непосредственно перед ним.
+    """
+    if capacity is not None and seats > capacity:
+        raise SeatsUnavailable()
+    statement = insert(TourDeparture).values(
+        tour_id=tour_id,
+        travel_date=departure_date(travel_date),
+        capacity=capacity,
+        reserved=seats,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[TourDeparture.tour_id, TourDeparture.travel_date],
+        set_={
+            "reserved": TourDeparture.reserved + statement.excluded.reserved,
+            "capacity": statement.excluded.capacity,
+        },
+        where=or_(
+            statement.excluded.capacity.is_(None),
+            TourDeparture.reserved + statement.excluded.reserved <= statement.excluded.capacity,
+        ),
+    ).returning(TourDeparture.reserved)
+    if db.execute(statement).first() is None:
+        raise SeatsUnavailable()
+
+def release_seats(db: Session, tour_id: int, travel_date: datetime, seats: int):
+    """Возвращает места (брони, созданные до учета мест, не уводят счетчик в минус)"""
+    db.execute(
+        update(TourDeparture)
+        .where(
+            TourDeparture.tour_id == tour_id,
+            TourDeparture.travel_date == departure_date(travel_date),
+        )
+        .values(reserved=func.greatest(TourDeparture.reserved - seats, 0))
+        .execution_options(synchronize_session=False)
+    )
@@ -1,25 +1,45 @@
 # booking-service/src/main.py
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Response, Header
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, func, insert, update
+from sqlalchemy.exc import SQLAlchemyError
 from typing import List, Optional
 from datetime import datetime
 from decimal import Decimal
-import httpx
+import asyncio
+import logging
 import os
 
 # Импорты для работы в контейнере
-from .models import Booking as BookingModel
+from .models import Booking as BookingModel, BookingStatsCounter
 from .schemas import (
     BookingCreate, BookingUpdate, BookingStatusUpdate, 
-    Booking as BookingSchema, BookingStats
+    Booking as BookingSchema, BookingStats,
+    BookingBulkCreate, BookingBulkItemResult, BookingBulkResult
 )
-from .database import SessionLocal, engine, get_db
-from .auth_utils import verify_token, validate_user_exists
+from .database import (
+    SessionLocal, engine, get_db, run_db, shutdown_db_executor,
+    db_state, refresh_db_status, start_db_monitor, stop_db_monitor,
+)
+from .auth_utils import decode_token, decode_user_token, has_role, validate_user_exists, get_users_from_auth_service, token_cache
+from .http_clients import auth_client, tours_client, start_clients, close_clients, get_upstream_stats
+from .tour_cache import get_tour, get_tours, invalidate_tour, tour_cache
+from .pagination import paginate, finish_page
+from . import idempotency, inventory, revocation
+from .metrics import MetricsMiddleware, ServiceCollector, register_collector, metrics_response
+from .logging_config import setup_logging, debug_sampled, RequestIdMiddleware
+from .tracing import setup_tracing, instrument_engine, TracingMiddleware
+from .deadline import DeadlineMiddleware
 
 # Таблицы создаются в init.sql при инициализации БД
 
+setup_logging("booking-service")
+setup_tracing("booking-service")
+instrument_engine(engine)
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Booking Service",
     description="Microservice for managing tour bookings",
@@ -28,80 +48,227 @@ app = FastAPI(
 
 security = HTTPBearer()
 
-# Функция для получения текущего пользователя из токена
-async def get_current_user(
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(TracingMiddleware)
+register_collector(ServiceCollector(
+    engine,
+    caches={"token": token_cache, "tour": tour_cache},
+    stats={
+        "upstream_auth": auth_client.get_stats,
+        "upstream_tours": tours_client.get_stats,
+        "revocation": lambda: revocation.revocation_stats,
+    },
+))
+
+# Источник /bookings/stats: "query" — агрегат по bookings, "table" — счетчики booking_stats
+BOOKING_STATS_SOURCE = os.getenv("BOOKING_STATS_SOURCE", "query")
+# Включены ли триггер и счетчики в БД (режим table); до этого статистика считается агрегатом
+stats_counters = {"enabled": False}
+
+def _enable_stats_counters():
+    """Ставит триггер booking_stats и засевает счетчики (идемпотентно, см. init.sql)"""
+    db = SessionLocal()
+    try:
+        seeded = db.execute(text("SELECT enable_booking_stats_counters()")).scalar()
+        db.commit()
+    finally:
+        db.close()
+    stats_counters["enabled"] = True
+    if seeded:
+        logger.info("Счетчики booking_stats включены и засеяны из bookings")
+
+async def ensure_stats_counters() -> bool:
+    if not stats_counters["enabled"]:
+        try:
+            await run_db(_enable_stats_counters)
+        except SQLAlchemyError as e:
+            logger.error("Не удалось включить счетчики booking_stats: %s", e)
+    return stats_counters["enabled"]
+
+@app.on_event("startup")
+async def startup():
+    start_db_monitor()
+    start_clients()
+    idempotency.start_purge_task()
+    revocation.start_revocation_poller("booking-service")
+    if BOOKING_STATS_SOURCE == "table":
+        await ensure_stats_counters()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_db_monitor()
+    await idempotency.stop_purge_task()
+    await revocation.stop_revocation_poller()
+    shutdown_db_executor()
+    await close_clients()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+# Claims токена (sub, uid, roles) проверяются локально: подпись, срок и список отозванных
+async def get_token_claims(
     credentials: HTTPAuthorizationCredentials = Depends(security)
-):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    username = verify_token(credentials.credentials)
-    if username is None:
+) -> dict:
+    claims = decode_user_token(credentials.credentials)
+    if claims is None or revocation.is_revoked(claims["uid"]):
         raise credentials_exception
-    
-    return username
+    return claims
+
+# Функция для получения текущего пользователя из токена
+async def get_current_user(claims: dict = Depends(get_token_claims)):
+    return claims["sub"]
 
 @app.get("/health")
 async def health_check():
-    try:
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        db_status = "connected"
-    except Exception:
-        db_status = "disconnected"
+    db_status = db_state["status"]
+    if db_status == "unknown":
+        # Монитор еще не успел отработать — проверяем один раз сами
+        db_status = await refresh_db_status()
     
     return {
         "status": "healthy" if db_status == "connected" else "unhealthy",
         "service": "booking-service", 
         "database": db_status,
+        "token_cache": token_cache.stats(),
+        "revocation": revocation.revocation_stats,
+        "upstreams": get_upstream_stats(),
+        "tour_cache": tour_cache.stats(),
         "timestamp": datetime.utcnow().isoformat()
     }
 # Вспомогательная функция для получения цены тура
 async def get_tour_price(tour_id: int) -> Decimal:
-    """Получает цену тура из tours-service"""
+    """Получает цену тура (из локального кэша или tours-service)"""
+    tour = await get_tour(tour_id)
+    return Decimal(str(tour["price"]))
+
+# DELETE /internal/tour-cache/{tour_id} - сбросить кэш тура (вызывает tours-service)
+@app.delete("/internal/tour-cache/{tour_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def invalidate_tour_cache(
+    tour_id: int,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    # Сбрасывать кэш могут только сервисы и администраторы, как для /internal/revoked-users
+    claims = decode_token(credentials.credentials)
+    if claims is None or not (has_role(claims, "service") or has_role(claims, "admin")):
+        raise credentials_exception
+    if claims.get("uid") is not None and revocation.is_revoked(claims["uid"]):
+        raise credentials_exception
+    invalidate_tour(tour_id)
+
+async def run_concurrently(*coros):
+    """Выполняет корутины параллельно; при первой ошибке отменяет остальные"""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
     try:
-        async with httpx.AsyncClient() as client:
-            # В Docker compose используем имя сервиса
-            tours_service_url = os.getenv("TOURS_SERVICE_URL", "http://tours-service:8001")
-            # Эндпоинт /tours/{tour_id} не требует аутентификации, поэтому не передаем токен
-            response = await client.get(f"{tours_service_url}/tours/{tour_id}")
-            if response.status_code == 200:
-                tour_data = response.json()
-                return Decimal(str(tour_data["price"]))
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Tour not found"
-                )
-    except httpx.RequestError as e:
-        print(f"Ошибка подключения к tours-service: {e}")
+        return await asyncio.gather(*tasks)
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        # Дожидаемся отмены, чтобы исключения отмененных задач не терялись в логах
+        await asyncio.gather(*pending, return_exceptions=True)
+
+def replay_response(stored, request_hash: bytes) -> JSONResponse:
+    """Повторяет сохраненный ответ для ключа Idempotency-Key"""
+    if stored.request_hash != request_hash:
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Tours service unavailable"
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used with a different request"
         )
+    return JSONResponse(
+        status_code=stored.status_code,
+        content=stored.response,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+def _reserve_and_commit(db: Session, tour_id: int, travel_date: datetime, seats: int, capacity: Optional[int]):
+    """Резерв мест — последний запрос транзакции: строка даты заблокирована только до commit"""
+    inventory.reserve_seats(db, tour_id, travel_date, seats, capacity)
+    db.commit()
+
+def _move_seats(
+    db: Session, tour_id: int, old_date: datetime, old_seats: int,
+    new_date: datetime, new_seats: int, capacity: Optional[int]
+):
+    """Переносит резерв при смене даты или числа участников в текущей транзакции"""
+    release = lambda: inventory.release_seats(db, tour_id, old_date, old_seats)
+    reserve = lambda: inventory.reserve_seats(db, tour_id, new_date, new_seats, capacity)
+    # Строки дат блокируются по возрастанию даты, чтобы встречные переносы не взаимоблокировались;
+    # для той же даты сначала освобождаем, чтобы старые места учитывались как свободные
+    if inventory.departure_date(old_date) <= inventory.departure_date(new_date):
+        steps = (release, reserve)
+    else:
+        steps = (reserve, release)
+    for step in steps:
+        step()
+
+def _update_if_unchanged(
+    db: Session, booking: BookingModel, values: dict, capacity: Optional[int]
+) -> Optional[BookingSchema]:
+    """UPDATE ... WHERE статус, дата и участники те же, что были прочитаны, RETURNING; затем перенос
+    резерва и commit. None — бронь параллельно отменили или изменили, резерв не тронут"""
+    updated = db.scalars(
+        update(BookingModel)
+        .where(
+            BookingModel.id == booking.id,
+            BookingModel.status == booking.status,
+            BookingModel.travel_date == booking.travel_date,
+            BookingModel.participants_count == booking.participants_count,
+        )
+        .values(**values)
+        .returning(BookingModel),
+        execution_options={"synchronize_session": False},
+    ).first()
+    if updated is None:
+        db.rollback()
+        return None
+    if (updated.travel_date, updated.participants_count) != (booking.travel_date, booking.participants_count):
+        _move_seats(
+            db, booking.tour_id, booking.travel_date, booking.participants_count,
+            updated.travel_date, updated.participants_count, capacity,
+        )
+    result = BookingSchema.model_validate(updated)
+    db.commit()
+    return result
 
 # POST /bookings - создать бронирование
 @app.post("/bookings", response_model=BookingSchema, status_code=status.HTTP_201_CREATED)
 async def create_booking(
     booking: BookingCreate, 
     current_user: str = Depends(get_current_user),
+    claims: dict = Depends(get_token_claims),
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", min_length=1, max_length=255)
 ):
+    # Повтор запроса с тем же ключом возвращает исходный ответ без обращения к соседним сервисам
+    if idempotency_key:
+        key_hash = idempotency.key_digest(current_user, idempotency_key)
+        request_hash = idempotency.request_digest(booking)
+        stored = await run_db(idempotency.get_stored_response, db, key_hash)
+        if stored is not None:
+            return replay_response(stored, request_hash)
+        # Закрываем транзакцию чтения: ответов auth и tours ждем без занятого соединения пула
+        await run_db(db.rollback)
+    
     try:
-        print(f"Создание бронирования: user_id={booking.user_id}, tour_id={booking.tour_id}")
-        
-        # Проверяем существование пользователя, передавая токен
-        await validate_user_exists(booking.user_id, credentials.credentials)
-        print("Пользователь найден")
-        
-        # Получаем цену тура из tours-service
-        tour_price = await get_tour_price(booking.tour_id)
+        # Проверяем пользователя (передавая токен) и получаем тур параллельно;
+        # бронирование на себя проверяется по claims токена без запроса к auth-service
+        _, tour = await run_concurrently(
+            validate_user_exists(booking.user_id, credentials.credentials, claims),
+            get_tour(booking.tour_id),
+        )
+        tour_price = Decimal(str(tour["price"]))
         total_price = tour_price * booking.participants_count
-        print(f"Цена тура: {tour_price}, общая цена: {total_price}")
+        debug_sampled(logger, "Цена бронирования", extra={"tour_price": tour_price, "total_price": total_price})
         
         db_booking = BookingModel(
             title=booking.title,
@@ -116,15 +283,197 @@ async def create_booking(
         )
         
         db.add(db_booking)
-        db.commit()
-        db.refresh(db_booking)
-        print(f"Бронирование создано с ID: {db_booking.id}")
-        return db_booking
+        await run_db(db.flush)
+        result = BookingSchema.model_validate(db_booking)
+        if idempotency_key:
+            # Ответ сохраняется в той же транзакции, что и бронирование
+            await run_db(idempotency.save_response, db, key_hash, request_hash, status.HTTP_201_CREATED, result)
+        await run_db(
+            _reserve_and_commit, db, booking.tour_id, booking.travel_date,
+            booking.participants_count, tour.get("capacity"),
+        )
+        logger.info("Бронирование создано", extra={
+            "booking_id": result.id, "user_id": booking.user_id, "tour_id": booking.tour_id,
+        })
+        return result
+    except HTTPException:
+        raise
+    except inventory.SeatsUnavailable:
+        await run_db(db.rollback)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Not enough seats available for this travel date"
+        )
+    except idempotency.IdempotencyConflict:
+        # Параллельный повтор с тем же ключом успел создать бронирование — отдаем его ответ
+        await run_db(db.rollback)
+        stored = await run_db(idempotency.get_stored_response, db, key_hash)
+        if stored is None:
+            # Запись конкурента еще не видна (транзакция не завершена или запись истекла)
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Request with this Idempotency-Key is in progress"
+            )
+        return replay_response(stored, request_hash)
     except Exception as e:
-        db.rollback()
-        print(f"Ошибка создания бронирования: {str(e)}")
+        await run_db(db.rollback)
+        logger.exception("Ошибка создания бронирования")
         raise HTTPException(status_code=500, detail=f"Error creating booking: {str(e)}")
 
+# POST /bookings/bulk - создать несколько бронирований одной транзакцией
+def _insert_bookings(db: Session, rows: List[dict], capacities: dict) -> List[Optional[BookingSchema]]:
+    """Резервирует места и вставляет строки одним многострочным INSERT ... RETURNING.
+
+    Места резервируются сразу на всю дату отправления; если их не хватает, все строки
+    этой даты получают None. Даты блокируются в порядке ключа — без взаимоблокировок.
+    """
+    departures = {}
+    for row in rows:
+        key = (row["tour_id"], inventory.departure_date(row["travel_date"]))
+        travel_date, seats = departures.get(key, (row["travel_date"], 0))
+        departures[key] = (travel_date, seats + row["participants_count"])
+    
+    rejected = set()
+    for key in sorted(departures):
+        travel_date, seats = departures[key]
+        try:
+            inventory.reserve_seats(db, key[0], travel_date, seats, capacities.get(key[0]))
+        except inventory.SeatsUnavailable:
+            rejected.add(key)
+    
+    accepted = [
+        row for row in rows
+        if (row["tour_id"], inventory.departure_date(row["travel_date"])) not in rejected
+    ]
+    bookings = []
+    if accepted:
+        bookings = db.scalars(
+            insert(BookingModel).returning(BookingModel, sort_by_parameter_order=True),
+            accepted,
+        ).all()
+    db.commit()
+    
+    created = iter(BookingSchema.model_validate(b) for b in bookings)
+    return [
+        None if (row["tour_id"], inventory.departure_date(row["travel_date"])) in rejected else next(created)
+        for row in rows
+    ]
+
+@app.post("/bookings/bulk", response_model=BookingBulkResult)
+async def create_bookings_bulk(
+    bulk: BookingBulkCreate,
+    current_user: str = Depends(get_current_user),
+    claims: dict = Depends(get_token_claims),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    items = bulk.items
+    # Каждый пользователь и тур запрашиваются один раз на весь пакет, оба запроса — параллельно
+    users, tours = await run_concurrently(
+        get_users_from_auth_service([item.user_id for item in items], credentials.credentials, claims),
+        get_tours([item.tour_id for item in items]),
+    )
+    
+    results = [None] * len(items)
+    rows = []
+    row_indexes = []
+    for index, item in enumerate(items):
+        if item.user_id not in users:
+            results[index] = BookingBulkItemResult(index=index, status="error", error="User not found")
+        elif item.tour_id not in tours:
+            results[index] = BookingBulkItemResult(index=index, status="error", error="Tour not found")
+        else:
+            tour_price = Decimal(str(tours[item.tour_id]["price"]))
+            rows.append({
+                **item.model_dump(),
+                "total_price": tour_price * item.participants_count,
+            })
+            row_indexes.append(index)
+    
+    if rows:
+        try:
+            capacities = {tour_id: tour.get("capacity") for tour_id, tour in tours.items()}
+            created = await run_db(_insert_bookings, db, rows, capacities)
+        except Exception as e:
+            await run_db(db.rollback)
+            logger.exception("Ошибка пакетного создания бронирований", extra={"rows": len(rows)})
+            raise HTTPException(status_code=500, detail=f"Error creating bookings: {str(e)}")
+        for index, booking in zip(row_indexes, created):
+            if booking is None:
+                results[index] = BookingBulkItemResult(
+                    index=index, status="error", error="Not enough seats available for this travel date"
+                )
+            else:
+                results[index] = BookingBulkItemResult(index=index, status="created", booking=booking)
+    
+    created_count = sum(1 for result in results if result.status == "created")
+    return BookingBulkResult(
+        created=created_count,
+        failed=len(items) - created_count,
+        results=results,
+    )
+
+# GET /bookings/stats - статистика бронирований (объявлен до /bookings/{booking_id})
+def _stats_from_bookings(db: Session) -> dict:
+    """Все счетчики и выручка одним агрегирующим запросом по bookings"""
+    paid = BookingModel.status.in_(["confirmed", "completed"])
+    row = db.query(
+        func.count(BookingModel.id),
+        func.count(BookingModel.id).filter(BookingModel.status == "pending"),
+        func.count(BookingModel.id).filter(BookingModel.status == "confirmed"),
+        func.count(BookingModel.id).filter(BookingModel.status == "cancelled"),
+        func.count(BookingModel.id).filter(BookingModel.status == "completed"),
+        func.coalesce(func.sum(BookingModel.total_price).filter(paid), 0),
+    ).one()
+    total, pending, confirmed, cancelled, completed, revenue = row
+    return {
+        "total_bookings": total,
+        "pending_bookings": pending,
+        "confirmed_bookings": confirmed,
+        "cancelled_bookings": cancelled,
+        "completed_bookings": completed,
+        "total_revenue": Decimal(str(revenue)),
+    }
+
+def _stats_from_counters(db: Session) -> dict:
+    """Счетчики из booking_stats, которую поддерживает триггер: O(1) от числа бронирований"""
+    rows = db.query(
+        BookingStatsCounter.status,
+        func.sum(BookingStatsCounter.bookings_count),
+        func.sum(BookingStatsCounter.revenue),
+    ).group_by(BookingStatsCounter.status).all()
+    counts = {"pending": 0, "confirmed": 0, "cancelled": 0, "completed": 0}
+    total_revenue = Decimal("0")
+    for status_name, count, revenue in rows:
+        counts[status_name] = int(count or 0)
+        if status_name in ("confirmed", "completed"):
+            total_revenue += Decimal(str(revenue or 0))
+    return {
+        "total_bookings": sum(counts.values()),
+        "pending_bookings": counts["pending"],
+        "confirmed_bookings": counts["confirmed"],
+        "cancelled_bookings": counts["cancelled"],
+        "completed_bookings": counts["completed"],
+        "total_revenue": total_revenue,
+    }
+
+@app.get("/bookings/stats", response_model=BookingStats)
+async def get_booking_stats(
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Пока счетчики не включены (например, БД была недоступна при старте), считаем агрегатом
+    if BOOKING_STATS_SOURCE == "table" and await ensure_stats_counters():
+        stats = await run_db(_stats_from_counters, db)
+    else:
+        stats = await run_db(_stats_from_bookings, db)
+    
+    confirmed_bookings = stats["confirmed_bookings"]
+    total_revenue = stats["total_revenue"]
+    average_booking_value = total_revenue / confirmed_bookings if confirmed_bookings > 0 else Decimal("0")
+    
+    return BookingStats(**stats, average_booking_value=average_booking_value)
+
 # GET /bookings/{id} - получить бронирование по ID
 @app.get("/bookings/{booking_id}", response_model=BookingSchema)
 async def get_booking(
@@ -132,7 +481,7 @@ async def get_booking(
     current_user: str = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    booking = db.query(BookingModel).filter(BookingModel.id == booking_id).first()
+    booking = await run_db(db.query(BookingModel).filter(BookingModel.id == booking_id).first)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     return booking
@@ -141,8 +490,10 @@ async def get_booking(
 @app.get("/bookings/user/{user_id}", response_model=List[BookingSchema])
 async def get_user_bookings(
     user_id: int, 
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor"),
     status_filter: Optional[str] = Query(None, alias="status"),
     current_user: str = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -152,22 +503,23 @@ async def get_user_bookings(
     if status_filter:
         query = query.filter(BookingModel.status == status_filter)
     
-    bookings = query.offset(skip).limit(limit).all()
-    return bookings
+    bookings = await run_db(paginate(query, BookingModel.id, cursor, skip, limit).all)
+    return finish_page(bookings, limit, response)
 
 # GET /bookings/tour/{tour_id} - бронирования конкретного тура
 @app.get("/bookings/tour/{tour_id}", response_model=List[BookingSchema])
 async def get_tour_bookings(
     tour_id: int,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor"),
     current_user: str = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    bookings = db.query(BookingModel).filter(
-        BookingModel.tour_id == tour_id
-    ).offset(skip).limit(limit).all()
-    return bookings
+    query = db.query(BookingModel).filter(BookingModel.tour_id == tour_id)
+    bookings = await run_db(paginate(query, BookingModel.id, cursor, skip, limit).all)
+    return finish_page(bookings, limit, response)
 
 # PUT /bookings/{id} - обновить бронирование
 @app.put("/bookings/{booking_id}", response_model=BookingSchema)
@@ -177,7 +529,7 @@ async def update_booking(
     current_user: str = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    db_booking = db.query(BookingModel).filter(BookingModel.id == booking_id).first()
+    db_booking = await run_db(db.query(BookingModel).filter(BookingModel.id == booking_id).first)
     if not db_booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
@@ -185,18 +537,62 @@ async def update_booking(
         raise HTTPException(status_code=400, detail="Cannot update cancelled booking")
     
     update_data = booking_update.model_dump(exclude_unset=True)
+    if not update_data:
+        return db_booking
+    # Прочитанное значение — только ожидание для условного UPDATE; пока ждем tours-service,
+    # соединение возвращено в пул (отсоединенный объект не перечитывается после rollback)
+    db.expunge(db_booking)
+    await run_db(db.rollback)
+    seats_changed = (
+        update_data.get("participants_count", db_booking.participants_count) != db_booking.participants_count
+        or update_data.get("travel_date", db_booking.travel_date) != db_booking.travel_date
+    )
     
     # Пересчитываем цену если изменилось количество участников
+    capacity = None
+    if seats_changed or "participants_count" in update_data:
+        tour = await get_tour(db_booking.tour_id)
+        capacity = tour.get("capacity")
     if "participants_count" in update_data:
-        tour_price = await get_tour_price(db_booking.tour_id)
+        tour_price = Decimal(str(tour["price"]))
         update_data["total_price"] = tour_price * update_data["participants_count"]
     
-    for field, value in update_data.items():
-        setattr(db_booking, field, value)
-    
+    # Проверка прочитанного состояния, запись и перенос резерва — в одной транзакции: параллельная
+    # отмена или другое изменение не освободит и не зарезервирует места дважды
+    try:
+        updated = await run_db(_update_if_unchanged, db, db_booking, update_data, capacity)
+    except inventory.SeatsUnavailable:
+        await run_db(db.rollback)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Not enough seats available for this travel date"
+        )
+    if updated is None:
+        raise HTTPException(status_code=409, detail="Booking was changed concurrently, retry the request")
+    return updated
+
+def _transition_status(
+    db: Session, booking_id: int, allowed: tuple, values: dict, release_seats: bool = False
+) -> Optional[BookingSchema]:
+    """Меняет статус одним UPDATE ... WHERE status IN (...) RETURNING; None — строка не подошла"""
+    booking = db.scalars(
+        update(BookingModel)
+        .where(BookingModel.id == booking_id, BookingModel.status.in_(allowed))
+        .values(**values)
+        .returning(BookingModel),
+        execution_options={"synchronize_session": False},
+    ).first()
+    if booking is None:
+        db.rollback()
+        return None
+    if release_seats:
+        inventory.release_seats(db, booking.tour_id, booking.travel_date, booking.participants_count)
+    result = BookingSchema.model_validate(booking)
     db.commit()
-    db.refresh(db_booking)
-    return db_booking
+    return result
+
+def _current_status(db: Session, booking_id: int) -> Optional[str]:
+    return db.query(BookingModel.status).filter(BookingModel.id == booking_id).scalar()
 
 # PUT /bookings/{id}/cancel - отменить бронирование
 @app.put("/bookings/{booking_id}/cancel", response_model=BookingSchema)
@@ -205,22 +601,22 @@ async def cancel_booking(
     current_user: str = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    db_booking = db.query(BookingModel).filter(BookingModel.id == booking_id).first()
-    if not db_booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    if db_booking.status == "cancelled":
-        raise HTTPException(status_code=400, detail="Booking already cancelled")
-    
-    if db_booking.status == "completed":
-        raise HTTPException(status_code=400, detail="Cannot cancel completed booking")
-    
-    db_booking.status = "cancelled"
-    db_booking.payment_status = "refunded"
+    # Проверка статуса и запись в одном запросе: две параллельные отмены не пройдут обе
+    booking = await run_db(
+        _transition_status, db, booking_id, ("pending", "confirmed"),
+        {"status": "cancelled", "payment_status": "refunded"},
+        release_seats=True,
+    )
+    if booking is not None:
+        return booking
     
-    db.commit()
-    db.refresh(db_booking)
-    return db_booking
+    # Второй запрос — только на неуспешном пути, чтобы выбрать между 404 и 409
+    current_status = await run_db(_current_status, db, booking_id)
+    if current_status is None:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    if current_status == "cancelled":
+        raise HTTPException(status_code=409, detail="Booking already cancelled")
+    raise HTTPException(status_code=409, detail="Cannot cancel completed booking")
 
 # POST /bookings/{id}/confirm - подтвердить бронирование
 @app.post("/bookings/{booking_id}/confirm", response_model=BookingSchema)
@@ -229,56 +625,24 @@ async def confirm_booking(
     current_user: str = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    db_booking = db.query(BookingModel).filter(BookingModel.id == booking_id).first()
-    if not db_booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    if db_booking.status != "pending":
-        raise HTTPException(status_code=400, detail="Only pending bookings can be confirmed")
-    
-    db_booking.status = "confirmed"
-    db_booking.payment_status = "paid"
-    
-    db.commit()
-    db.refresh(db_booking)
-    return db_booking
-
-# GET /bookings/stats - статистика бронирований
-@app.get("/bookings/stats", response_model=BookingStats)
-async def get_booking_stats(
-    current_user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    total_bookings = db.query(BookingModel).count()
-    
-    pending_bookings = db.query(BookingModel).filter(BookingModel.status == "pending").count()
-    confirmed_bookings = db.query(BookingModel).filter(BookingModel.status == "confirmed").count()
-    cancelled_bookings = db.query(BookingModel).filter(BookingModel.status == "cancelled").count()
-    completed_bookings = db.query(BookingModel).filter(BookingModel.status == "completed").count()
-    
-    # Подсчет общей выручки
-    revenue_result = db.query(BookingModel.total_price).filter(
-        BookingModel.status.in_(["confirmed", "completed"])
-    ).all()
-    total_revenue = sum(Decimal(str(row[0])) for row in revenue_result)
-    
-    average_booking_value = total_revenue / confirmed_bookings if confirmed_bookings > 0 else Decimal("0")
-    
-    return BookingStats(
-        total_bookings=total_bookings,
-        pending_bookings=pending_bookings,
-        confirmed_bookings=confirmed_bookings,
-        cancelled_bookings=cancelled_bookings,
-        completed_bookings=completed_bookings,
-        total_revenue=total_revenue,
-        average_booking_value=average_booking_value
+    booking = await run_db(
+        _transition_status, db, booking_id, ("pending",),
+        {"status": "confirmed", "payment_status": "paid"},
     )
+    if booking is not None:
+        return booking
+    
+    if await run_db(_current_status, db, booking_id) is None:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    raise HTTPException(status_code=409, detail="Only pending bookings can be confirmed")
 
 # GET /bookings - все бронирования (админ)
 @app.get("/bookings", response_model=List[BookingSchema])
 async def get_all_bookings(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor"),
     user_id: Optional[int] = Query(None),
     tour_id: Optional[int] = Query(None),
     status_filter: Optional[str] = Query(None, alias="status"),
@@ -296,8 +660,8 @@ async def get_all_bookings(
     if status_filter:
         query = query.filter(BookingModel.status == status_filter)
     
-    bookings = query.offset(skip).limit(limit).all()
-    return bookings
+    bookings = await run_db(paginate(query, BookingModel.id, cursor, skip, limit).all)
+    return finish_page(bookings, limit, response)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, SmallInteger, BigInteger, String, Boolean, DateTime, Numeric, Text, ForeignKey, Enum, LargeBinary, Date
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import ENUM, JSONB
 import enum
 
 from .database import Base
@@ -16,8 +17,13 @@ class PaymentStatus(enum.Enum):
     PAID = "paid"
     REFUNDED = "refunded"
 
+BookingStatusType = ENUM(*(s.value for s in BookingStatus), name="booking_status", create_type=False)
+PaymentStatusType = ENUM(*(s.value for s in PaymentStatus), name="payment_status", create_type=False)
+
 class Booking(Base):
     __tablename__ = "bookings"
+    # booking_date/created_at/updated_at возвращаются тем же INSERT/UPDATE ... RETURNING, без refresh
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False, index=True)
@@ -30,9 +36,10 @@ class Booking(Base):
     participants_count = Column(Integer, nullable=False, default=1)
     total_price = Column(Numeric(10, 2), nullable=False)
     
-    # Статусы как строки (ENUM в БД будет валидировать значения)
-    status = Column(String(20), default="pending")
-    payment_status = Column(String(20), default="pending")
+    # Статусы — строки, но тип колонки совпадает с ENUM в БД (типы создаются в init.sql),
+    # иначе вставки с явным приведением параметров падают с DatatypeMismatch
+    status = Column(BookingStatusType, default="pending")
+    payment_status = Column(PaymentStatusType, default="pending")
     
     # Дополнительная информация
     special_requests = Column(Text)
@@ -51,4 +58,32 @@ class Booking(Base):
         return self.status == "confirmed"
     
     def is_pending(self):
-        return self.status == "pending"
\ No newline at end of file
+        return self.status == "pending"
+
+class BookingStatsCounter(Base):
+    """Счетчики бронирований по статусам; ведутся триггером bookings_stats (см. init.sql)"""
+    __tablename__ = "booking_stats"
+
+    status = Column(BookingStatusType, primary_key=True)
+    slot = Column(SmallInteger, primary_key=True)
+    bookings_count = Column(BigInteger, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+
+class TourDeparture(Base):
+    """Занятые места тура на конкретную дату отправления (capacity NULL — без ограничения)"""
+    __tablename__ = "tour_departures"
+
+    tour_id = Column(Integer, primary_key=True)
+    travel_date = Column(Date, primary_key=True)
+    capacity = Column(Integer)
+    reserved = Column(Integer, nullable=False, default=0)
+
+class IdempotencyKey(Base):
+    """Сохраненные ответы POST /bookings по заголовку Idempotency-Key"""
+    __tablename__ = "idempotency_keys"
+
+    key_hash = Column(LargeBinary, primary_key=True)  # SHA-256 от пользователя и ключа
+    request_hash = Column(LargeBinary, nullable=False)  # SHA-256 тела запроса
+    status_code = Column(SmallInteger, nullable=False)
+    response = Column(JSONB, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
\ No newline at end of file
@@ -0,0 +1,63 @@
+# revocation.py — локальный список отозванных пользователей (одинаковый модуль в tours и booking)
+import asyncio
+import httpx
+import logging
+import os
+import time
+
+from .auth_utils import create_service_token
+
+logger = logging.getLogger(__name__)
+
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8000")
+# Период опроса auth-service (секунды): не дольше этого принимаются токены удаленного пользователя
+REVOCATION_POLL_INTERVAL = float(os.getenv("REVOCATION_POLL_INTERVAL", "10"))
+REVOCATION_TIMEOUT = float(os.getenv("REVOCATION_TIMEOUT", "2"))
+
+# Множество заменяется целиком при каждой синхронизации, поэтому проверка идет без блокировок.
+# Если auth-service недоступен, действует последний полученный список
+revoked_user_ids = frozenset()
+revocation_stats = {"revoked_users": 0, "syncs": 0, "sync_errors": 0, "last_sync_timestamp": 0.0}
+
+_poll_task = None
+
+def is_revoked(user_id: int) -> bool:
+    return user_id in revoked_user_ids
+
+async def sync_revoked_users(client: httpx.AsyncClient, service: str):
+    """Загружает актуальный список из auth-service GET /internal/revoked-users"""
+    global revoked_user_ids
+    response = await client.get(
+        "/internal/revoked-users",
+        headers={"Authorization": f"Bearer {create_service_token(service)}"},
+    )
+    response.raise_for_status()
+    revoked_user_ids = frozenset(response.json()["user_ids"])
+    revocation_stats["revoked_users"] = len(revoked_user_ids)
+    revocation_stats["syncs"] += 1
+    revocation_stats["last_sync_timestamp"] = time.time()
+
+async def _poll_loop(service: str):
+    async with httpx.AsyncClient(base_url=AUTH_SERVICE_URL, timeout=REVOCATION_TIMEOUT) as client:
+        while True:
+            try:
+                await sync_revoked_users(client, service)
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                revocation_stats["sync_errors"] += 1
+                logger.warning("Не удалось обновить список отозванных пользователей: %s", e)
+            await asyncio.sleep(REVOCATION_POLL_INTERVAL)
+
+def start_revocation_poller(service: str):
+    global _poll_task
+    if _poll_task is None:
+        _poll_task = asyncio.create_task(_poll_loop(service))
+
+async def stop_revocation_poller():
+    global _poll_task
+    if _poll_task is not None:
+        _poll_task.cancel()
+        try:
+            await _poll_task
+        except asyncio.CancelledError:
+            pass
+        _poll_task = None
@@ -44,6 +44,20 @@ class Booking(BaseModel):
     class Config:
         from_attributes = True
 
+class BookingBulkCreate(BaseModel):
+    items: List[BookingCreate] = Field(..., min_length=1, max_length=100)
+
+class BookingBulkItemResult(BaseModel):
+    index: int
+    status: str
+    booking: Optional[Booking] = None
+    error: Optional[str] = None
+
+class BookingBulkResult(BaseModel):
+    created: int
+    failed: int
+    results: List[BookingBulkItemResult]
+
 class BookingStats(BaseModel):
     total_bookings: int
     pending_bookings: int
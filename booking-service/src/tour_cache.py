@@ -0,0 +1,101 @@
+# booking-service/src/tour_cache.py
+from fastapi import HTTPException, status
+import asyncio
+import httpx
+import logging
+import os
+
+from .cache import TTLCache
+from .http_clients import tours_client
+
+logger = logging.getLogger(__name__)
+
+# Локальный кэш снимков туров (цена меняется редко, tours-service сбрасывает его при изменениях)
+TOUR_CACHE_SIZE = int(os.getenv("TOUR_CACHE_SIZE", "5000"))
+TOUR_CACHE_TTL = float(os.getenv("TOUR_CACHE_TTL", "60"))
+tour_cache = TTLCache(TOUR_CACHE_SIZE, TOUR_CACHE_TTL)
+
+# Запросы к tours-service, которые уже выполняются: параллельные промахи ждут один и тот же
+_inflight = {}
+
+async def _fetch_tour(tour_id: int) -> dict:
+    try:
+        # Эндпоинт /tours/{tour_id} не требует аутентификации, поэтому не передаем токен
+        response = await tours_client.get(f"/tours/{tour_id}")
+    except httpx.RequestError as e:
+        logger.warning("Ошибка подключения к tours-service: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Tours service unavailable"
+        )
+    if response.status_code == 200:
+        return response.json()
+    if response.status_code == 404:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tour not found"
+        )
+    logger.warning("Ошибка от tours-service", extra={"tour_id": tour_id, "status": response.status_code})
+    raise HTTPException(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        detail="Tours service error"
+    )
+
+async def _load_tour(tour_id: int) -> dict:
+    try:
+        tour = await _fetch_tour(tour_id)
+        # Если тур инвалидировали, пока шел запрос, ответ может быть устаревшим — не кэшируем
+        if _inflight.get(tour_id) is asyncio.current_task():
+            tour_cache.set(tour_id, tour)
+        return tour
+    finally:
+        if _inflight.get(tour_id) is asyncio.current_task():
+            del _inflight[tour_id]
+
+async def get_tour(tour_id: int) -> dict:
+    """Возвращает снимок тура из кэша или из tours-service"""
+    tour = tour_cache.get(tour_id)
+    if tour is not None:
+        return tour
+    task = _inflight.get(tour_id)
+    if task is None:
+        task = asyncio.ensure_future(_load_tour(tour_id))
+        _inflight[tour_id] = task
+    # shield: отмена одного ожидающего запроса не должна отменять общий запрос
+    return await asyncio.shield(task)
+
+async def get_tours(tour_ids) -> dict:
+    """Снимки нескольких туров: из кэша, а недостающие — одним запросом GET /tours?ids="""
+    found = {}
+    missing = []
+    for tour_id in dict.fromkeys(tour_ids):
+        tour = tour_cache.get(tour_id)
+        if tour is None:
+            missing.append(tour_id)
+        else:
+            found[tour_id] = tour
+    if not missing:
+        return found
+
+    try:
+        response = await tours_client.get("/tours", params={"ids": ",".join(str(i) for i in missing)})
+    except httpx.RequestError as e:
+        logger.warning("Ошибка подключения к tours-service: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Tours service unavailable"
+        )
+    if response.status_code != 200:
+        logger.warning("Ошибка от tours-service", extra={"status": response.status_code})
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Tours service error"
+        )
+    for tour in response.json():
+        tour_cache.set(tour["id"], tour)
+        found[tour["id"]] = tour
+    return found
+
+def invalidate_tour(tour_id: int):
+    tour_cache.pop(tour_id)
+    _inflight.pop(tour_id, None)
@@ -0,0 +1,165 @@
+# tracing.py — распределенная трассировка OpenTelemetry (одинаковый модуль во всех сервисах)
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+import json
+import logging
+import os
+import threading
+
+# Файл JSON-lines для спанов (удобно разбирать офлайн); пусто — не писать
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+# OTLP/HTTP-коллектор, например http://otel-collector:4318 (нужен opentelemetry-exporter-otlp-proto-http)
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+# Доля трасс, которые начинаются в этом сервисе; входящее решение вызывающего сохраняется
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+# Длина SQL в атрибуте db.statement
+MAX_STATEMENT_LENGTH = 500
+
+logger = logging.getLogger(__name__)
+
+# Без настроенного провайдера это no-op трассировщик: контекст вызывающего пробрасывается дальше,
+# но спаны не записываются
+tracer = trace.get_tracer("tourism-platform")
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Пишет завершенные спаны в файл, по одному JSON-объекту на строку"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> SpanExportResult:
+        lines = "".join(json.dumps(span_to_dict(span), ensure_ascii=False, default=str) + "\n" for span in spans)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError:
+            logger.exception("Не удалось записать спаны", extra={"path": self.path})
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+def span_to_dict(span) -> dict:
+    context = span.get_span_context()
+    return {
+        "trace_id": format(context.trace_id, "032x"),
+        "span_id": format(context.span_id, "016x"),
+        "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+        "service": span.resource.attributes.get("service.name"),
+        "name": span.name,
+        "kind": span.kind.name,
+        "start_ns": span.start_time,
+        "duration_ms": round((span.end_time - span.start_time) / 1e6, 3),
+        "status": span.status.status_code.name,
+        "attributes": dict(span.attributes),
+    }
+
+def setup_tracing(service: str):
+    """Включает запись спанов, если задан хотя бы один экспортер (TRACE_FILE или OTLP)"""
+    if not TRACE_FILE and not OTLP_ENDPOINT:
+        return
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service}),
+        sampler=ParentBased(TraceIdRatioBased(TRACE_SAMPLE_RATIO)),
+    )
+    if TRACE_FILE:
+        provider.add_span_processor(BatchSpanProcessor(JsonLinesSpanExporter(TRACE_FILE)))
+    if OTLP_ENDPOINT:
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT задан, но opentelemetry-exporter-otlp-proto-http не установлен")
+        else:
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+
+def inject_context(headers: dict) -> dict:
+    """Добавляет traceparent/tracestate текущего спана в заголовки исходящего запроса"""
+    propagate.inject(headers)
+    return headers
+
+class TracingMiddleware:
+    """Чистый ASGI middleware: серверный спан на запрос, родитель — traceparent вызывающего"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+            if name in (b"traceparent", b"tracestate")
+        }
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with tracer.start_as_current_span(
+            f"{method} {scope['path']}",
+            context=propagate.extract(carrier),
+            kind=SpanKind.SERVER,
+            attributes={"http.method": method, "http.target": scope["path"]},
+        ) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # Имя спана — шаблон маршрута, известный только после маршрутизации
+                route = scope.get("route")
+                if route is not None:
+                    span.update_name(f"{method} {route.path}")
+                    span.set_attribute("http.route", route.path)
+                span.set_attribute("http.status_code", status_code)
+                if status_code >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
+
+def instrument_engine(engine):
+    """Спан на каждый SQL-запрос внутри трассируемого запроса (контекст копирует run_db)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Фоновые проверки БД вне запроса не порождают отдельных трасс
+        if not trace.get_current_span().is_recording():
+            return
+        context._trace_span = tracer.start_span(
+            f"db {statement.split(None, 1)[0].upper()}" if statement else "db",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": "postgresql",
+                "db.statement": statement[:MAX_STATEMENT_LENGTH],
+                "db.executemany": executemany,
+            },
+        )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.set_attribute("db.rowcount", cursor.rowcount)
+            span.end()
+            context._trace_span = None
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_trace_span", None) if context is not None else None
+        if span is not None:
+            span.record_exception(exception_context.original_exception)
+            span.set_status(Status(StatusCode.ERROR))
+            span.end()
+            context._trace_span = None
@@ -15,39 +15,130 @@ from src.main import app  # noqa: E402
 from src.database import get_db  # noqa: E402
 
 
-class _FakeQuery:
+class FakeResult:
+    """Result of execute()/scalars()/query(): a fixed list of rows."""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def all(self):
+        return list(self.rows)
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchone(self):
+        return self.first()
+
+    def one(self):
+        assert len(self.rows) == 1, self.rows
+        return self.rows[0]
+
+    def scalar(self):
+        row = self.first()
+        return row[0] if isinstance(row, tuple) else row
+
+    def count(self):
+        return len(self.rows)
+
+
+class FakeQuery(FakeResult):
+    """Chainable ORM query; filters are recorded by the session, not applied."""
+
     def filter(self, *args, **kwargs):
         return self
 
+    def filter_by(self, *args, **kwargs):
+        return self
+
     def offset(self, *args, **kwargs):
         return self
 
+    def order_by(self, *args, **kwargs):
+        return self
+
+    def group_by(self, *args, **kwargs):
+        return self
+
     def limit(self, *args, **kwargs):
         return self
 
-    def all(self):
-        return []
+    def delete(self, *args, **kwargs):
+        return len(self.rows)
 
-    def first(self):
-        return None
 
-    def count(self):
-        return 0
+class FakeSession:
+    """In-memory stand-in for a SQLAlchemy session.
+
+    Results are queued per call: ``query_results`` for query(), ``execute_results`` for
+    execute()/scalars(). An entry is a list of rows or a callable(statement, params) returning
+    one. With an empty queue ``execute_handler`` answers if set; otherwise query() returns
+    no rows and execute() returns ``(1,)``.
+    """
+
+    def __init__(self):
+        self.query_results = []
+        self.execute_results = []
+        self.objects = {}  # (model, primary key) -> object for get()
+        self.queries = []
+        self.statements = []
+        self.added = []
+        self.deleted = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.execute_handler = None
+        self.on_flush = None
+
+    def query(self, *entities):
+        self.queries.append(entities)
+        return FakeQuery(self.query_results.pop(0) if self.query_results else [])
+
+    def execute(self, statement, params=None, **kwargs):
+        return self._result(statement, params, default=[(1,)])
+
+    def scalars(self, statement, params=None, **kwargs):
+        return self._result(statement, params, default=[])
+
+    def _result(self, statement, params, default):
+        self.statements.append(statement)
+        if self.execute_results:
+            rows = self.execute_results.pop(0)
+        elif self.execute_handler is not None:
+            rows = self.execute_handler
+        else:
+            return FakeResult(default)
+        return FakeResult(rows(statement, params) if callable(rows) else rows)
 
+    def get(self, model, key):
+        return self.objects.get((model, key))
 
-class _FakeSession:
-    def query(self, *args, **kwargs):
-        return _FakeQuery()
+    def add(self, obj):
+        self.added.append(obj)
 
-    def execute(self, *args, **kwargs):
-        class _Res:
-            def fetchone(self):
-                return (1,)
-        return _Res()
+    def delete(self, obj):
+        self.deleted.append(obj)
 
+    def expunge(self, obj):
+        pass
 
-def _fake_get_db() -> _t.Iterator[_FakeSession]:
-    yield _FakeSession()
+    def flush(self):
+        if self.on_flush is not None:
+            for obj in self.added:
+                self.on_flush(obj)
+
+    def commit(self):
+        self.flush()
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+def _fake_get_db() -> _t.Iterator[FakeSession]:
+    yield FakeSession()
 
 
 @pytest.fixture(autouse=True)
@@ -59,3 +150,27 @@ def _override_db_dependency():
         app.dependency_overrides.pop(get_db, None)
 
 
+@pytest.fixture
+def fake_db() -> FakeSession:
+    """One FakeSession shared by every request of the test (inspect it afterwards)."""
+    session = FakeSession()
+    app.dependency_overrides[get_db] = lambda: session
+    return session
+
+
+@pytest.fixture
+def make_token() -> _t.Callable[..., str]:
+    """Factory of signed access tokens; uid/roles claims are omitted when None."""
+    from datetime import datetime, timedelta
+    from jose import jwt
+    from src import auth_utils
+
+    def _make(sub: str, uid: _t.Optional[int] = None, roles: _t.Optional[_t.Iterable[str]] = None) -> str:
+        claims = {"sub": sub, "exp": datetime.utcnow() + timedelta(minutes=5)}
+        if uid is not None:
+            claims["uid"] = uid
+        if roles is not None:
+            claims["roles"] = list(roles)
+        return jwt.encode(claims, auth_utils.SECRET_KEY, algorithm=auth_utils.ALGORITHM)
+
+    return _make
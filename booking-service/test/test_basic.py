@@ -18,3 +18,657 @@ def test_health_endpoint_returns_ok():
     assert body.get("status") in {"healthy", "unhealthy"}
 
 
+def test_verify_token_uses_cache_until_expiry(make_token):
+    from src import auth_utils
+
+    token = make_token("alice", 1)
+    hits = auth_utils.token_cache.hits
+    assert auth_utils.verify_token(token) == "alice"
+    assert auth_utils.verify_token(token) == "alice"
+    assert auth_utils.token_cache.hits == hits + 1
+    assert auth_utils.verify_token(token + "x") is None
+
+
+def test_get_tour_price_uses_shared_tours_client():
+    import asyncio
+    import httpx
+    from decimal import Decimal
+    from src import http_clients
+    from src.main import get_tour_price
+
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        return httpx.Response(200, json={"price": 150.5})
+
+    async def scenario():
+        http_clients.tours_client._client = httpx.AsyncClient(
+            base_url="http://tours", transport=httpx.MockTransport(handler)
+        )
+        try:
+            return await get_tour_price(1)
+        finally:
+            await http_clients.tours_client.aclose()
+
+    assert asyncio.run(scenario()) == Decimal("150.5")
+    assert seen == ["/tours/1"]
+
+
+def test_run_concurrently_cancels_siblings_on_failure():
+    import asyncio
+    import pytest
+    from src.main import run_concurrently
+
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def failing():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(run_concurrently(slow(), failing()))
+    assert cancelled == [True]
+
+
+def test_tour_cache_coalesces_concurrent_misses_and_invalidates():
+    import asyncio
+    import httpx
+    from src import http_clients, tour_cache
+
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"id": 42, "price": 99.0})
+
+    async def scenario():
+        http_clients.tours_client._client = httpx.AsyncClient(
+            base_url="http://tours", transport=httpx.MockTransport(handler)
+        )
+        try:
+            tours = await asyncio.gather(*(tour_cache.get_tour(42) for _ in range(5)))
+            assert all(t["price"] == 99.0 for t in tours)
+            assert len(calls) == 1
+            await tour_cache.get_tour(42)
+            assert len(calls) == 1
+            tour_cache.invalidate_tour(42)
+            await tour_cache.get_tour(42)
+            assert len(calls) == 2
+        finally:
+            tour_cache.invalidate_tour(42)
+            await http_clients.tours_client.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_tour_cache_invalidation_requires_service_or_admin_role(make_token):
+    customer = make_token("bob", 2, roles=[])
+    response = client.delete("/internal/tour-cache/42", headers={"Authorization": f"Bearer {customer}"})
+    assert response.status_code == 401
+
+    for token in (make_token("admin", 1, roles=["admin"]), make_token("tours-service", roles=["service"])):
+        response = client.delete("/internal/tour-cache/42", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 204
+
+
+def test_booking_stats_route_uses_single_aggregate_query(fake_db, make_token):
+    from decimal import Decimal
+
+    fake_db.query_results = [[(6, 1, 2, 1, 2, Decimal("400.00"))]]
+    token = make_token("alice", 1)
+    response = client.get("/bookings/stats", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total_bookings"] == 6
+    assert Decimal(body["total_revenue"]) == Decimal("400.00")
+    assert Decimal(body["average_booking_value"]) == Decimal("200.00")
+    assert len(fake_db.queries) == 1
+
+
+def test_booking_stats_table_mode_falls_back_until_counters_are_enabled(fake_db, monkeypatch, make_token):
+    from decimal import Decimal
+    from sqlalchemy.exc import OperationalError
+    from src import main
+
+    attempts = []
+
+    def enable(succeed):
+        def _enable():
+            attempts.append(succeed)
+            if not succeed:
+                raise OperationalError("SELECT enable_booking_stats_counters()", {}, Exception("db down"))
+            main.stats_counters["enabled"] = True
+        return _enable
+
+    monkeypatch.setattr(main, "BOOKING_STATS_SOURCE", "table")
+    monkeypatch.setitem(main.stats_counters, "enabled", False)
+    token = make_token("alice", 1)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # Счетчики не включились — ответ по агрегату, а не по пустой booking_stats
+    monkeypatch.setattr(main, "_enable_stats_counters", enable(False))
+    fake_db.query_results = [[(2, 1, 1, 0, 0, Decimal("100.00"))]]
+    assert client.get("/bookings/stats", headers=headers).json()["total_bookings"] == 2
+
+    monkeypatch.setattr(main, "_enable_stats_counters", enable(True))
+    fake_db.query_results = [[("confirmed", 3, Decimal("300.00"))]]
+    body = client.get("/bookings/stats", headers=headers).json()
+    assert (body["total_bookings"], body["confirmed_bookings"]) == (3, 3)
+    # После успешного включения повторных попыток нет
+    client.get("/bookings/stats", headers=headers)
+    assert attempts == [False, True]
+
+
+def test_bulk_booking_dedupes_upstream_lookups_and_inserts_once(fake_db, make_token):
+    import json
+    import httpx
+    from datetime import datetime
+    from types import SimpleNamespace
+    from src import http_clients
+    from src.tour_cache import invalidate_tour
+
+    upstream_calls = []
+
+    def auth_handler(request):
+        ids = json.loads(request.content)["ids"]
+        upstream_calls.append(("auth", ids))
+        return httpx.Response(200, json=[{"id": i} for i in ids if i != 404])
+
+    def tours_handler(request):
+        ids = [int(i) for i in request.url.params["ids"].split(",")]
+        upstream_calls.append(("tours", ids))
+        return httpx.Response(200, json=[{"id": i, "price": 50.0} for i in ids])
+
+    inserted = []
+
+    def reserve(statement, params):
+        # Резерв мест: upsert возвращает новое значение reserved
+        return [(statement.compile().params["reserved"],)]
+
+    def insert_rows(statement, rows):
+        inserted.append(rows)
+        now = datetime.utcnow()
+        return [SimpleNamespace(
+            id=100 + n, booking_date=now, created_at=now, updated_at=now,
+            status="pending", payment_status="pending", special_requests=None,
+            contact_phone=None, contact_email=None, **{
+                k: row[k] for k in ("title", "user_id", "tour_id", "travel_date",
+                                    "participants_count", "total_price")
+            },
+        ) for n, row in enumerate(rows)]
+
+    fake_db.execute_results = [reserve, insert_rows]
+    http_clients.auth_client._client = httpx.AsyncClient(
+        base_url="http://auth", transport=httpx.MockTransport(auth_handler))
+    http_clients.tours_client._client = httpx.AsyncClient(
+        base_url="http://tours", transport=httpx.MockTransport(tours_handler))
+    token = make_token("agent", 100)
+    item = lambda user_id, tour_id: {
+        "title": "Group", "user_id": user_id, "tour_id": tour_id,
+        "travel_date": "2030-01-01T00:00:00Z", "participants_count": 2,
+    }
+    try:
+        response = client.post(
+            "/bookings/bulk",
+            json={"items": [item(1, 7), item(1, 7), item(404, 7)]},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+    finally:
+        invalidate_tour(7)
+        http_clients.auth_client._client = None
+        http_clients.tours_client._client = None
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["failed"]) == (2, 1)
+    assert [r["status"] for r in body["results"]] == ["created", "created", "error"]
+    assert upstream_calls == [("auth", [1, 404]), ("tours", [7])]
+    assert len(inserted) == 1 and len(inserted[0]) == 2
+    # Обе строки на одну дату — места резервируются одним запросом
+    assert len(fake_db.statements) == 2
+    assert fake_db.statements[0].compile().params["reserved"] == 4
+
+
+def test_create_booking_replays_stored_response_for_idempotency_key(make_token):
+    from types import SimpleNamespace
+    from src import idempotency, schemas
+
+    booking = {
+        "title": "Trip", "user_id": 1, "tour_id": 7,
+        "travel_date": "2030-01-01T00:00:00Z", "participants_count": 2,
+    }
+    stored = SimpleNamespace(
+        request_hash=idempotency.request_digest(schemas.BookingCreate(**booking)),
+        status_code=201,
+        response={"id": 42},
+    )
+    lookups = []
+
+    def fake_lookup(db, key_hash):
+        lookups.append(key_hash)
+        return stored
+
+    original = idempotency.get_stored_response
+    idempotency.get_stored_response = fake_lookup
+    token = make_token("agent", 100)
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "k-1"}
+    try:
+        replayed = client.post("/bookings", json=booking, headers=headers)
+        mismatched = client.post("/bookings", json=dict(booking, participants_count=3), headers=headers)
+    finally:
+        idempotency.get_stored_response = original
+
+    assert replayed.status_code == 201
+    assert replayed.json() == {"id": 42}
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert mismatched.status_code == 422
+    assert lookups == [idempotency.key_digest("agent", "k-1")] * 2
+
+
+def test_booking_writes_return_server_values_without_refresh(make_token):
+    import httpx
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from src import http_clients
+    from src.database import SessionLocal, get_db
+    from src.models import Booking, TourDeparture
+    from src.tour_cache import invalidate_tour
+
+    # Настоящая сессия с настройками SessionLocal поверх SQLite в памяти: считаем SQL, который уходит в БД
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", lambda dbapi_conn, record: dbapi_conn.create_function("greatest", -1, max))
+    Booking.__table__.create(engine)
+    TourDeparture.__table__.create(engine)
+    session_factory = sessionmaker(**{**SessionLocal.kw, "bind": engine})
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement.split()[0].upper()))
+
+    def sqlite_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = sqlite_db
+    http_clients.tours_client._client = httpx.AsyncClient(
+        base_url="http://tours",
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"id": 8, "price": 10.0, "capacity": 5})))
+    token = make_token("alice", 5)
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        created = client.post("/bookings", json={
+            "title": "Trip", "user_id": 5, "tour_id": 8,
+            "travel_date": "2030-01-01T10:00:00Z", "participants_count": 2,
+        }, headers=headers)
+        create_statements, statements[:] = list(statements), []
+        updated = client.put("/bookings/1", json={"participants_count": 3}, headers=headers)
+        update_statements = list(statements)
+    finally:
+        invalidate_tour(8)
+        http_clients.tours_client._client = None
+        engine.dispose()
+
+    assert created.status_code == 201
+    assert created.json()["booking_date"] is not None and created.json()["status"] == "pending"
+    assert updated.status_code == 200
+    assert updated.json()["participants_count"] == 3 and updated.json()["updated_at"] is not None
+    # Серверные колонки приходят через RETURNING, а commit не сбрасывает загруженные атрибуты:
+    # ни после INSERT, ни после UPDATE нет повторного SELECT (refresh или перечитывания)
+    assert "SELECT" not in create_statements
+    assert update_statements[0] == "SELECT"
+    assert "SELECT" not in update_statements[1:]
+
+
+def test_cancel_booking_is_single_conditional_update(fake_db, make_token):
+
+    token = make_token("agent", 100)
+    headers = {"Authorization": f"Bearer {token}"}
+    # UPDATE ... RETURNING не находит строку; затем статус: брони нет / уже отменена
+    fake_db.query_results = [[], [("cancelled",)]]
+    missing = client.put("/bookings/5/cancel", headers=headers)
+    cancelled = client.put("/bookings/5/cancel", headers=headers)
+
+    assert missing.status_code == 404
+    assert cancelled.status_code == 409
+    assert len(fake_db.statements) == 2
+    assert all("bookings.status IN" in str(statement) for statement in fake_db.statements)
+    assert all("RETURNING" in str(statement) for statement in fake_db.statements)
+
+
+def test_metrics_endpoint_reports_route_templates_and_pool():
+    client.get("/bookings/123")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    # Метка — шаблон маршрута, а не конкретный путь
+    assert 'http_requests_total{method="GET",route="/bookings/{booking_id}",status="403"}' in body
+    assert "/bookings/123" not in body
+    assert "db_pool_checked_out" in body
+    assert 'cache_hit_ratio{cache="tour"}' in body
+
+
+def test_request_id_is_echoed_and_attached_to_json_logs():
+    import asyncio
+    import json
+    import logging
+    from src.database import run_db
+    from src.logging_config import JsonFormatter, ContextFilter, request_id_var
+
+    response = client.get("/health", headers={"X-Request-ID": "req-42"})
+    assert response.headers["X-Request-ID"] == "req-42"
+    assert client.get("/health").headers["X-Request-ID"]
+
+    async def log_from_db_thread():
+        request_id_var.set("req-7")
+        record = logging.LogRecord("src.main", logging.INFO, __file__, 1, "created %s", (5,), None)
+        record.booking_id = 5
+        # Фильтр срабатывает в потоке пула БД — контекст запроса должен быть скопирован туда
+        await run_db(ContextFilter("booking-service").filter, record)
+        return record
+
+    record = asyncio.run(log_from_db_thread())
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["request_id"] == "req-7"
+    assert entry["service"] == "booking-service"
+    assert entry["message"] == "created 5"
+    assert entry["booking_id"] == 5
+
+
+def test_trace_context_propagates_to_upstream_calls(tmp_path):
+    import asyncio
+    import json
+    import httpx
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from src import http_clients
+    from src.tracing import JsonLinesSpanExporter, tracer
+
+    trace_file = tmp_path / "spans.jsonl"
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(JsonLinesSpanExporter(str(trace_file))))
+    trace.set_tracer_provider(provider)
+
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    response = client.get("/health", headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"})
+    assert response.status_code == 200
+
+    seen = []
+    upstream = http_clients.UpstreamClient("tours-service", "http://tours")
+    upstream._client = httpx.AsyncClient(
+        base_url="http://tours",
+        transport=httpx.MockTransport(lambda request: seen.append(request.headers["traceparent"]) or httpx.Response(200)),
+    )
+
+    async def call_upstream():
+        with tracer.start_as_current_span("parent"):
+            await upstream.get("/tours/1")
+
+    asyncio.run(call_upstream())
+
+    spans = {span["name"]: span for span in map(json.loads, trace_file.read_text().splitlines())}
+    server = spans["GET /health"]
+    assert server["trace_id"] == trace_id
+    assert server["parent_id"] == "00f067aa0ba902b7"
+    assert server["kind"] == "SERVER"
+    client_span = spans["GET tours-service"]
+    assert client_span["parent_id"] == spans["parent"]["span_id"]
+    # Заголовок traceparent указывает на клиентский спан — вызываемый сервис станет его потомком
+    assert [header.split("-")[1:3] for header in seen] == [[client_span["trace_id"], client_span["span_id"]]]
+
+
+def test_upstream_retries_idempotent_calls_and_breaker_short_circuits(monkeypatch):
+    import asyncio
+    import time
+    import httpx
+    import pytest
+    from fastapi import HTTPException
+    from src import auth_utils, http_clients
+    from src.deadline import BUDGET_HEADER, deadline_var
+
+    monkeypatch.setattr(http_clients, "HTTP_RETRY_BASE_DELAY", 0)
+    calls = []
+
+    def handler(request):
+        calls.append((request.method, request.headers.get(BUDGET_HEADER)))
+        return httpx.Response(503)
+
+    upstream = http_clients.UpstreamClient("auth-service", "http://auth")
+    upstream.breaker = http_clients.CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    upstream._client = httpx.AsyncClient(base_url="http://auth", transport=httpx.MockTransport(handler))
+
+    # GET повторяется (1 + HTTP_RETRIES попыток), POST по умолчанию — нет
+    assert asyncio.run(upstream.get("/users/1")).status_code == 503
+    assert len(calls) == 1 + http_clients.HTTP_RETRIES
+    assert upstream.breaker.state == "open"
+    assert upstream.get_stats()["circuit_open"] == 1
+
+    # Разомкнутый автомат отвечает сразу, не обращаясь к соседу; auth_utils превращает это в 503
+    monkeypatch.setattr(auth_utils, "auth_client", upstream)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(auth_utils.get_user_from_auth_service(1, "t"))
+    assert exc_info.value.status_code == 503
+    assert len(calls) == 1 + http_clients.HTTP_RETRIES
+    assert upstream.stats["short_circuited"] == 1
+
+    # Остаток бюджета уходит соседу в заголовке; истекший бюджет — ответ без обращения к соседу
+    upstream.breaker = http_clients.CircuitBreaker()
+    calls.clear()
+
+    async def call_with_budget(seconds):
+        deadline_var.set(time.monotonic() + seconds)
+        return await upstream.post("/users/batch")
+
+    asyncio.run(call_with_budget(1.5))
+    assert len(calls) == 1
+    assert 0 < int(calls[0][1]) <= 1500
+    with pytest.raises(http_clients.DeadlineExceeded):
+        asyncio.run(call_with_budget(0))
+    assert len(calls) == 1
+    assert client.get("/health", headers={BUDGET_HEADER: "0"}).status_code == 504
+
+
+def _server_defaults(booking):
+    # Значения, которые в БД проставляет INSERT ... RETURNING
+    from datetime import datetime
+
+    now = datetime.utcnow()
+    booking.id, booking.booking_date, booking.created_at, booking.updated_at = 1, now, now, now
+    booking.status, booking.payment_status = "pending", "pending"
+
+
+def test_booking_for_token_owner_skips_auth_service(fake_db, make_token):
+    import httpx
+    from src import http_clients
+    from src.tour_cache import invalidate_tour
+
+    auth_calls = []
+    fake_db.on_flush = _server_defaults
+    http_clients.auth_client._client = httpx.AsyncClient(
+        base_url="http://auth",
+        transport=httpx.MockTransport(lambda request: auth_calls.append(request.url.path) or httpx.Response(404)))
+    http_clients.tours_client._client = httpx.AsyncClient(
+        base_url="http://tours",
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"id": 8, "price": 10.0})))
+    token = make_token("alice", 5, roles=["user"])
+    headers = {"Authorization": f"Bearer {token}"}
+    booking = lambda user_id: {
+        "title": "Trip", "user_id": user_id, "tour_id": 8, "travel_date": "2030-01-01T00:00:00Z",
+    }
+    try:
+        own = client.post("/bookings", json=booking(5), headers=headers)
+        other = client.post("/bookings", json=booking(6), headers=headers)
+    finally:
+        invalidate_tour(8)
+        http_clients.auth_client._client = None
+        http_clients.tours_client._client = None
+
+    assert own.status_code == 201
+    # Для чужого user_id существование по-прежнему проверяет auth-service
+    assert other.status_code == 404
+    assert auth_calls == ["/users/6"]
+
+
+def test_departure_overbooking_returns_409_and_cancel_frees_seats(fake_db, make_token):
+    import httpx
+    from src import http_clients
+    from src.tour_cache import invalidate_tour
+
+    reserved = {"seats": 0}
+
+    def database(statement, params):
+        values = statement.compile().params
+        if statement.table.name == "bookings":
+            # Отмена: UPDATE bookings ... RETURNING возвращает первую бронь
+            fake_db.added[0].status = "cancelled"
+            return [fake_db.added[0]]
+        if statement.is_insert:
+            # Условный upsert по дате отправления: строка возвращается, только если места есть
+            if reserved["seats"] + values["reserved"] > values["capacity"]:
+                return []
+            reserved["seats"] += values["reserved"]
+            return [(reserved["seats"],)]
+        reserved["seats"] = max(reserved["seats"] - values["reserved_1"], 0)
+        return []
+
+    fake_db.execute_handler = database
+    fake_db.on_flush = _server_defaults
+    http_clients.tours_client._client = httpx.AsyncClient(
+        base_url="http://tours",
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"id": 8, "price": 10.0, "capacity": 3})))
+    token = make_token("alice", 5, roles=["user"])
+    headers = {"Authorization": f"Bearer {token}"}
+    booking = {
+        "title": "Trip", "user_id": 5, "tour_id": 8,
+        "travel_date": "2030-01-01T10:00:00Z", "participants_count": 2,
+    }
+    try:
+        first = client.post("/bookings", json=booking, headers=headers)
+        overbooked = client.post("/bookings", json=booking, headers=headers)
+        too_large = client.post("/bookings", json=dict(booking, participants_count=4), headers=headers)
+        cancelled = client.put("/bookings/1/cancel", headers=headers)
+        after_cancel = client.post("/bookings", json=booking, headers=headers)
+    finally:
+        invalidate_tour(8)
+        http_clients.tours_client._client = None
+
+    assert first.status_code == 201
+    assert overbooked.status_code == 409
+    assert overbooked.json()["detail"] == "Not enough seats available for this travel date"
+    assert too_large.status_code == 409
+    assert cancelled.status_code == 200
+    # Отмена вернула 2 места, новая бронь на ту же дату снова помещается
+    assert after_cancel.status_code == 201
+    assert reserved["seats"] == 2
+
+
+def test_idempotency_conflict_without_stored_response_returns_409(fake_db, monkeypatch, make_token):
+    import httpx
+    from src import http_clients, idempotency
+    from src.tour_cache import invalidate_tour
+
+    def conflict(*args):
+        raise idempotency.IdempotencyConflict()
+
+    # Конкурент занял ключ, но его транзакция еще не зафиксирована — сохраненного ответа нет
+    monkeypatch.setattr(idempotency, "get_stored_response", lambda db, key_hash: None)
+    monkeypatch.setattr(idempotency, "save_response", conflict)
+    fake_db.on_flush = _server_defaults
+    rollbacks_at_upstream = []
+
+    def tours_handler(request):
+        rollbacks_at_upstream.append(fake_db.rollbacks)
+        return httpx.Response(200, json={"id": 9, "price": 10.0})
+
+    http_clients.tours_client._client = httpx.AsyncClient(
+        base_url="http://tours",
+        transport=httpx.MockTransport(tours_handler))
+    token = make_token("alice", 5, roles=["user"])
+    booking = {
+        "title": "Trip", "user_id": 5, "tour_id": 9,
+        "travel_date": "2030-01-01T10:00:00Z", "participants_count": 1,
+    }
+    try:
+        response = client.post(
+            "/bookings", json=booking,
+            headers={"Authorization": f"Bearer {token}", "Idempotency-Key": "k-2"},
+        )
+    finally:
+        invalidate_tour(9)
+        http_clients.tours_client._client = None
+
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Request with this Idempotency-Key is in progress"
+    # Транзакция поиска ключа закрыта до запроса к tours-service, вторая — после конфликта
+    assert rollbacks_at_upstream == [1]
+    assert fake_db.rollbacks == 2
+
+
+def test_update_booking_is_conditional_and_keeps_seats_on_concurrent_change(fake_db, make_token):
+    import httpx
+    from datetime import datetime, timezone
+    from types import SimpleNamespace
+    from src import http_clients
+    from src.tour_cache import invalidate_tour
+
+    travel_date = datetime(2030, 1, 1, 10, tzinfo=timezone.utc)
+    fake_db.query_results = [[SimpleNamespace(
+        id=1, tour_id=8, status="pending", travel_date=travel_date, participants_count=2,
+    )]]
+    # Бронь отменили между чтением и записью: условный UPDATE не находит строку
+    fake_db.execute_handler = lambda statement, params: []
+    http_clients.tours_client._client = httpx.AsyncClient(
+        base_url="http://tours",
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"id": 8, "price": 10.0, "capacity": 5})))
+    token = make_token("alice", 5, roles=["user"])
+    try:
+        response = client.put(
+            "/bookings/1", json={"participants_count": 3}, headers={"Authorization": f"Bearer {token}"},
+        )
+    finally:
+        invalidate_tour(8)
+        http_clients.tours_client._client = None
+
+    assert response.status_code == 409
+    [statement] = fake_db.statements
+    assert statement.table.name == "bookings"
+    params = statement.compile().params
+    assert (params["status_1"], params["participants_count_1"]) == ("pending", 2)
+    assert fake_db.commits == 0
+
+
+def test_users_batch_maps_auth_service_statuses_like_single_lookup():
+    import asyncio
+    import httpx
+    from fastapi import HTTPException
+    from src import http_clients
+    from src.auth_utils import get_users_from_auth_service
+
+    async def lookup(status_code):
+        http_clients.auth_client._client = httpx.AsyncClient(
+            base_url="http://auth", transport=httpx.MockTransport(lambda request: httpx.Response(status_code)))
+        try:
+            return await get_users_from_auth_service([2, 3], "token")
+        except HTTPException as e:
+            return e.status_code
+        finally:
+            await http_clients.auth_client.aclose()
+            http_clients.auth_client._client = None
+
+    # Истекший или отозванный токен — 401, а не ошибка шлюза; 502 — только для сбоев auth-service
+    assert asyncio.run(lookup(401)) == 401
+    assert asyncio.run(lookup(404)) == {}
+    assert asyncio.run(lookup(500)) == 502
@@ -4,9 +4,6 @@ let currentUser = null;
 var lala = new Audio("./sounds/gunshot-mem-short.mp3")
 var lala_eagle = new Audio("./sounds/eagle.mp3")
 
-// Список администраторов (в реальном приложении это должно быть в базе данных)
-const ADMIN_USERS = ['admin', 'manager', 'root', 'boss']; // Добавьте сюда логины администраторов
-
 function showSection(name){
   document.getElementById('section-tours').classList.toggle('hidden', name!=='tours');
   document.getElementById('section-bookings').classList.toggle('hidden', name!=='bookings');
@@ -58,25 +55,95 @@ function getToken(){
   return localStorage.getItem('token'); 
 }
 
+function setRefreshToken(token){
+  if(token){
+    localStorage.setItem('refresh_token', token);
+  } else {
+    localStorage.removeItem('refresh_token');
+  }
+}
+
+// Продлевает сессию по refresh-токену (без повторной проверки пароля).
+// Параллельные 401 ждут один и тот же запрос: каждый refresh-токен можно предъявить только раз
+let refreshInFlight = null;
+function refreshSession(){
+  const refreshToken = localStorage.getItem('refresh_token');
+  if(!refreshToken) return Promise.resolve(false);
+  if(!refreshInFlight){
+    refreshInFlight = fetch('/api/auth/token/refresh', {
+      method:'POST',
+      headers:{'Content-Type':'application/json'},
+      body: JSON.stringify({ refresh_token: refreshToken })
+    })
+      .then(async res => {
+        if(!res.ok) return false;
+        const data = await res.json();
+        setRefreshToken(data.refresh_token);
+        // Пользователь тот же — меняем только токен, без перерисовки интерфейса
+        localStorage.setItem('token', data.access_token);
+        return true;
+      })
+      .catch(() => false)
+      .finally(() => { refreshInFlight = null; });
+  }
+  return refreshInFlight;
+}
+
+// Claims из JWT (подпись проверяет сервер, здесь они нужны только для интерфейса)
+function tokenClaims(){
+  const t = getToken();
+  if(!t) return null;
+  try {
+    const payload = t.split('.')[1].replace(/-/g, '+').replace(/_/g, '/');
+    return JSON.parse(atob(payload));
+  } catch (e) {
+    return null;
+  }
+}
+
 function authHeader(){
   const t = getToken();
   return t ? { Authorization: `Bearer ${t}` } : {};
 }
 
-// Универсальная функция для обработки 401 ошибок
-function handleUnauthorized() {
+// Универсальная функция для обработки 401 ошибок: сначала пробуем продлить сессию.
+// Возвращает true, если сессия продлена и запрос можно повторить
+async function handleUnauthorized() {
+  if (await refreshSession()) {
+    console.log('Сессия продлена по refresh-токену');
+    return true;
+  }
   console.log('Токен истек, выходим из системы');
+  setRefreshToken(null);
   setToken(null);
-  updateAuthState(false);
+  return false;
+}
+
+// Запрос с токеном: на 401 продлеваем сессию и повторяем запрос один раз.
+// Если вернулся 401, сессия уже завершена — вызывающему остается показать сообщение
+async function authFetch(url, options = {}) {
+  const send = () => fetch(url, { ...options, headers: { ...(options.headers || {}), ...authHeader() } });
+  const res = await send();
+  if (res.status !== 401 || !(await handleUnauthorized())) {
+    return res;
+  }
+  const retried = await send();
+  if (retried.status === 401) {
+    setRefreshToken(null);
+    setToken(null);
+  }
+  return retried;
 }
 
 // Функция проверки роли администратора
 function isAdmin() {
-  const isAdminUser = currentUser && ADMIN_USERS.includes(currentUser.username);
+  // Роли выдает auth-service в токене — те же, что проверяют сервисы
+  const roles = tokenClaims()?.roles || [];
+  const isAdminUser = !!currentUser && roles.includes('admin');
   console.log('🔍 Проверка прав администратора:', {
     currentUser: currentUser?.username,
     isAdmin: isAdminUser,
-    adminUsers: ADMIN_USERS
+    roles
   });
   return isAdminUser;
 }
@@ -132,7 +199,7 @@ function updateAuthState(isAuthenticated) {
 async function loadCurrentUser() {
   try {
     console.log('👤 Загружаем данные пользователя...');
-    const res = await fetch('/api/auth/users/me', { headers: authHeader() });
+    const res = await authFetch('/api/auth/users/me');
     console.log('Response status:', res.status);
     
     if (res.ok) {
@@ -168,10 +235,8 @@ async function loadCurrentUser() {
       
       // Обновляем туры после загрузки данных пользователя
       loadTours();
-    } else if (res.status === 401) {
-      // Если токен истек (401), выходим из системы
-      handleUnauthorized();
     }
+    // 401 здесь означает, что продлить сессию не удалось и authFetch уже вышел из системы
   } catch (error) {
     console.error('Ошибка загрузки пользователя:', error);
   }
@@ -180,7 +245,8 @@ async function loadCurrentUser() {
 async function loadTours(){
   try {
   const dest = document.getElementById('filter-destination').value.trim();
-  const url = dest ? `/api/tours/tours?destination=${encodeURIComponent(dest)}` : `/api/tours/tours`;
+  // q= — полнотекстовый поиск по названию, направлению и описанию (с ранжированием)
+  const url = dest ? `/api/tours/tours?q=${encodeURIComponent(dest)}` : `/api/tours/tours`;
     // GET /tours не требует аутентификации, поэтому не передаем токен
     const res = await fetch(url);
     
@@ -197,7 +263,7 @@ async function loadTours(){
       isAuthenticated,
       isAdminUser,
       currentUser: currentUser?.username,
-      adminUsers: ADMIN_USERS
+      roles: tokenClaims()?.roles || []
     });
     
   root.innerHTML = data.map(t => {
@@ -269,7 +335,7 @@ async function bookTour(tourId) {
     console.log('Данные пользователя:', currentUser);
     
     // Получаем информацию о туре
-    const tourRes = await fetch(`/api/tours/tours/${tourId}`, { headers: authHeader() });
+    const tourRes = await authFetch(`/api/tours/tours/${tourId}`);
     if (!tourRes.ok) {
       throw new Error(`Тур не найден: HTTP ${tourRes.status}`);
     }
@@ -290,9 +356,9 @@ async function bookTour(tourId) {
     
     console.log('Отправляем данные бронирования:', bookingPayload);
     
-    const res = await fetch('/api/bookings/bookings', { 
+    const res = await authFetch('/api/bookings/bookings', { 
       method: 'POST', 
-      headers: {...{'Content-Type': 'application/json'}, ...authHeader()}, 
+      headers: {'Content-Type': 'application/json'}, 
       body: JSON.stringify(bookingPayload)
     });
     
@@ -352,9 +418,9 @@ async function handleTourForm(e){
       console.log('Текущий пользователь:', currentUser);
       console.log('Токен авторизации:', getToken() ? 'Есть' : 'Нет');
       console.log('Заголовки запроса:', {...{'Content-Type': 'application/json'}, ...authHeader()});
-      res = await fetch(`/api/tours/tours/${tourId}`, { 
+      res = await authFetch(`/api/tours/tours/${tourId}`, { 
         method: 'PUT', 
-        headers: {...{'Content-Type': 'application/json'}, ...authHeader()}, 
+        headers: {'Content-Type': 'application/json'}, 
         body: JSON.stringify(payload)
       });
     } else {
@@ -362,9 +428,9 @@ async function handleTourForm(e){
       console.log('➕ Создание нового тура');
       console.log('Текущий пользователь:', currentUser);
       console.log('Токен авторизации:', getToken() ? 'Есть' : 'Нет');
-      res = await fetch('/api/tours/tours', { 
+      res = await authFetch('/api/tours/tours', { 
         method: 'POST', 
-        headers: {...{'Content-Type': 'application/json'}, ...authHeader()}, 
+        headers: {'Content-Type': 'application/json'}, 
         body: JSON.stringify(payload)
       });
     }
@@ -405,7 +471,7 @@ async function editTour(tourId) {
   lala_eagle.play();
   try {
     console.log('✏️ Редактирование тура:', tourId);
-    const res = await fetch(`/api/tours/tours/${tourId}`, { headers: authHeader() });
+    const res = await authFetch(`/api/tours/tours/${tourId}`);
     console.log('Response status:', res.status);
     
     if (!res.ok) {
@@ -457,10 +523,7 @@ async function deleteTour(tourId) {
   
   try {
     console.log('Отправляем запрос на удаление...');
-    const res = await fetch(`/api/tours/tours/${tourId}`, { 
-      method: 'DELETE', 
-      headers: authHeader() 
-    });
+    const res = await authFetch(`/api/tours/tours/${tourId}`, { method: 'DELETE' });
     
     console.log('Response status:', res.status);
     
@@ -513,12 +576,11 @@ async function loadBookings(){
     console.log('URL:', url);
     console.log('Заголовки:', authHeader());
     
-    const res = await fetch(url, { headers: authHeader() });
+    const res = await authFetch(url);
     
     if (!res.ok) {
-      // Если токен истек (401), выходим из системы
+      // 401 после authFetch: сессию продлить не удалось, пользователь уже разлогинен
       if (res.status === 401) {
-        handleUnauthorized();
         document.getElementById('bookings-list').innerHTML = '<div class="card error">🔒 Сессия истекла. Войдите в систему заново.</div>';
         return;
       }
@@ -619,11 +681,10 @@ function getPaymentText(status) {
 
 async function cancelBooking(id){
   try {
-    const res = await fetch(`/api/bookings/bookings/${id}/cancel`, { method:'PUT', headers: authHeader() });
+    const res = await authFetch(`/api/bookings/bookings/${id}/cancel`, { method:'PUT' });
     if (!res.ok) {
-      // Если токен истек (401), выходим из системы
+      // 401 после authFetch: сессию продлить не удалось, пользователь уже разлогинен
       if (res.status === 401) {
-        handleUnauthorized();
         return;
       }
       const errorData = await res.json().catch(() => ({ detail: 'Неизвестная ошибка' }));
@@ -641,11 +702,10 @@ async function cancelBooking(id){
 
 async function confirmBooking(id){
   try {
-    const res = await fetch(`/api/bookings/bookings/${id}/confirm`, { method:'POST', headers: authHeader() });
+    const res = await authFetch(`/api/bookings/bookings/${id}/confirm`, { method:'POST' });
     if (!res.ok) {
-      // Если токен истек (401), выходим из системы
+      // 401 после authFetch: сессию продлить не удалось, пользователь уже разлогинен
       if (res.status === 401) {
-        handleUnauthorized();
         return;
       }
       const errorData = await res.json().catch(() => ({ detail: 'Неизвестная ошибка' }));
@@ -680,6 +740,7 @@ async function login(e){
     
   const data = await res.json();
     if (data.access_token) {
+      setRefreshToken(data.refresh_token);
       setToken(data.access_token);
       document.getElementById('login-status').textContent = '✅ Успешно!';
       document.getElementById('login-status').className = 'status success';
@@ -726,6 +787,16 @@ async function registerUser(e){
 }
 
 function logout(){ 
+  // Отзываем refresh-токены этого входа на сервере (ответ не ждем)
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (refreshToken) {
+    fetch('/api/auth/logout', {
+      method:'POST',
+      headers:{'Content-Type':'application/json'},
+      body: JSON.stringify({ refresh_token: refreshToken })
+    }).catch(() => {});
+  }
+  setRefreshToken(null);
   setToken(null); 
   showSection('tours'); // Переключаемся на туры
 }
@@ -744,9 +815,9 @@ async function createTestTour() {
       available: true
     };
     
-    const res = await fetch('/api/tours/tours', { 
+    const res = await authFetch('/api/tours/tours', { 
       method: 'POST', 
-      headers: {...{'Content-Type': 'application/json'}, ...authHeader()}, 
+      headers: {'Content-Type': 'application/json'}, 
       body: JSON.stringify(testTour)
     });
     
@@ -813,12 +884,11 @@ async function loadUsers() {
   }
   
   try {
-    const res = await fetch('/api/auth/users', { headers: authHeader() });
+    const res = await authFetch('/api/auth/users');
     
     if (!res.ok) {
-      // Если токен истек (401), выходим из системы
+      // 401 после authFetch: сессию продлить не удалось, пользователь уже разлогинен
       if (res.status === 401) {
-        handleUnauthorized();
         document.getElementById('users-list').innerHTML = '<div class="card error">🔒 Сессия истекла. Войдите в систему заново.</div>';
         return;
       }
@@ -843,7 +913,8 @@ async function loadUsers() {
 // Функция создания карточки пользователя
 function createUserCard(user) {
   const isCurrentUser = currentUser && user.id === currentUser.id;
-  const isAdminUser = ADMIN_USERS.includes(user.username);
+  // Роли пользователя отдает auth-service (те же, что он кладет в токен)
+  const isAdminUser = (user.roles || []).includes('admin');
   
   return `
     <div class="card user-card ${isCurrentUser ? 'current-user' : ''}">
@@ -881,10 +952,7 @@ async function deleteUser(userId, username) {
   
   try {
     console.log('Отправляем запрос на удаление пользователя...');
-    const res = await fetch(`/api/auth/users/${userId}`, { 
-      method: 'DELETE', 
-      headers: authHeader() 
-    });
+    const res = await authFetch(`/api/auth/users/${userId}`, { method: 'DELETE' });
     
     console.log('Response status:', res.status);
     
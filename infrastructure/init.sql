@@ -16,8 +16,30 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Удаленные пользователи: их токены отклоняются до истечения срока (tours и booking опрашивают список)
+CREATE TABLE IF NOT EXISTS revoked_users (
+    user_id INTEGER PRIMARY KEY,
+    revoked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_revoked_users_revoked_at ON revoked_users(revoked_at);
+
+-- Refresh-токены (POST /token/refresh): хранится SHA-256 токена, family_id — цепочка одного входа
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    token_hash BYTEA PRIMARY KEY,
+    family_id UUID NOT NULL,
+    user_id INTEGER NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    revoked_at TIMESTAMP WITH TIME ZONE
+);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family_id ON refresh_tokens(family_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON refresh_tokens(user_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at ON refresh_tokens(expires_at);
+
 -- tours_db (туры)
 \c tours_db;
+-- Триграммы для поиска по подстроке (ILIKE '%...%' и нечеткие совпадения)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 CREATE TABLE IF NOT EXISTS tours (
     id SERIAL PRIMARY KEY,
     title VARCHAR(200) NOT NULL,
@@ -26,11 +48,36 @@ CREATE TABLE IF NOT EXISTS tours (
     price DECIMAL(10,2) NOT NULL,
     duration_days INTEGER NOT NULL,
     available BOOLEAN DEFAULT true,
+    capacity INTEGER CHECK (capacity > 0), -- мест на одну дату отправления; NULL — без ограничения
     features TEXT[],
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Полнотекстовый индекс каталога (параметр q в GET /tours)
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(destination, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
 );
 
+-- Таблица, созданная до появления мест и поиска, CREATE TABLE IF NOT EXISTS не меняет:
+-- на существующей БД колонки добавляются повторным запуском скрипта (psql -f init.sql)
+ALTER TABLE tours ADD COLUMN IF NOT EXISTS capacity INTEGER CHECK (capacity > 0);
+ALTER TABLE tours ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(destination, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_tours_search_vector ON tours USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_tours_destination_trgm ON tours USING GIN (destination gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_tours_title_trgm ON tours USING GIN (title gin_trgm_ops);
+-- Фильтры и сортировки каталога: диапазоны и keyset-пагинация по (ключ, id), содержимое features
+CREATE INDEX IF NOT EXISTS idx_tours_price_id ON tours(price, id);
+CREATE INDEX IF NOT EXISTS idx_tours_duration_id ON tours(duration_days, id);
+CREATE INDEX IF NOT EXISTS idx_tours_created_at_id ON tours(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_tours_features ON tours USING GIN (features);
+
 -- booking_db (бронирования)
 \c booking_db;
 
@@ -62,4 +109,98 @@ CREATE INDEX IF NOT EXISTS idx_bookings_tour_id ON bookings(tour_id);
 CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status);
 CREATE INDEX IF NOT EXISTS idx_bookings_payment_status ON bookings(payment_status);
 CREATE INDEX IF NOT EXISTS idx_bookings_travel_date ON bookings(travel_date);
-CREATE INDEX IF NOT EXISTS idx_bookings_booking_date ON bookings(booking_date);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_bookings_booking_date ON bookings(booking_date);
+-- Keyset-пагинация списков бронирований пользователя и тура (WHERE ... AND id > :cursor ORDER BY id)
+CREATE INDEX IF NOT EXISTS idx_bookings_user_id_id ON bookings(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_bookings_tour_id_id ON bookings(tour_id, id);
+
+-- Занятые места по турам и датам отправления. Бронирование резервирует места одним
+-- условным upsert (reserved + n <= capacity) прямо перед commit, поэтому блокировка
+-- строки держится только на время фиксации транзакции
+CREATE TABLE IF NOT EXISTS tour_departures (
+    tour_id INTEGER NOT NULL,
+    travel_date DATE NOT NULL,
+    capacity INTEGER,
+    reserved INTEGER NOT NULL DEFAULT 0 CHECK (reserved >= 0),
+    PRIMARY KEY (tour_id, travel_date)
+);
+
+-- Ответы POST /bookings по заголовку Idempotency-Key (хеши вместо исходных ключей и тел)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key_hash BYTEA PRIMARY KEY,
+    request_hash BYTEA NOT NULL,
+    status_code SMALLINT NOT NULL,
+    response JSONB NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+
+-- Счетчики для /bookings/stats (BOOKING_STATS_SOURCE=table), ведутся триггером.
+-- Каждый статус разбит на 16 слотов по pg_backend_pid(), чтобы параллельные
+-- вставки не выстраивались в очередь за блокировкой одной строки.
+-- Триггер не ставится по умолчанию: его включает booking-service при старте в режиме table
+-- (enable_booking_stats_counters), в режиме query записи в bookings за счетчики не платят
+CREATE TABLE IF NOT EXISTS booking_stats (
+    status booking_status NOT NULL,
+    slot SMALLINT NOT NULL,
+    bookings_count BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (status, slot)
+);
+
+CREATE OR REPLACE FUNCTION booking_stats_apply(p_status booking_status, p_count INTEGER, p_revenue DECIMAL)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO booking_stats (status, slot, bookings_count, revenue)
+    VALUES (p_status, pg_backend_pid() % 16, p_count, p_revenue)
+    ON CONFLICT (status, slot) DO UPDATE
+    SET bookings_count = booking_stats.bookings_count + EXCLUDED.bookings_count,
+        revenue = booking_stats.revenue + EXCLUDED.revenue;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bookings_stats_trigger()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM booking_stats_apply(OLD.status, -1, -OLD.total_price);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM booking_stats_apply(NEW.status, 1, NEW.total_price);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Ставит триггер и засевает счетчики текущими бронированиями; повторный вызов ничего не делает.
+-- На время засева запись в bookings блокируется, чтобы ни одно изменение не прошло мимо счетчиков
+CREATE OR REPLACE FUNCTION enable_booking_stats_counters()
+RETURNS boolean AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = 'bookings'::regclass AND tgname = 'bookings_stats') THEN
+        RETURN false;
+    END IF;
+    LOCK TABLE bookings IN SHARE ROW EXCLUSIVE MODE;
+    -- Параллельный вызов мог успеть включить счетчики, пока ждали блокировку
+    IF EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = 'bookings'::regclass AND tgname = 'bookings_stats') THEN
+        RETURN false;
+    END IF;
+    DELETE FROM booking_stats;
+    INSERT INTO booking_stats (status, slot, bookings_count, revenue)
+    SELECT status, 0, count(*), coalesce(sum(total_price), 0)
+    FROM bookings
+    GROUP BY status;
+    CREATE TRIGGER bookings_stats
+    AFTER INSERT OR DELETE OR UPDATE OF status, total_price ON bookings
+    FOR EACH ROW EXECUTE FUNCTION bookings_stats_trigger();
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Возврат к режиму query: счетчики больше не ведутся (следующее включение засеет их заново)
+CREATE OR REPLACE FUNCTION disable_booking_stats_counters()
+RETURNS void AS $$
+BEGIN
+    DROP TRIGGER IF EXISTS bookings_stats ON bookings;
+END;
+$$ LANGUAGE plpgsql;
\ No newline at end of file
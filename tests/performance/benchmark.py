@@ -0,0 +1,247 @@
+# tests/performance/benchmark.py
+"""Нагрузочный прогон запущенных сервисов: задержки p50/p95/p99 и пропускная способность.
+
+Пример:
+    python tests/performance/benchmark.py --concurrency 20 --requests 500 \
+        --output perf-results.json --baseline perf-baseline.json
+
+Код выхода 1 — есть регрессия относительно baseline (или все запросы сценария упали).
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+
+import httpx
+
+BASE_AUTH = os.getenv("AUTH_BASE_URL", "http://localhost:8000")
+BASE_TOURS = os.getenv("TOURS_BASE_URL", "http://localhost:8001")
+BASE_BOOKING = os.getenv("BOOKING_BASE_URL", "http://localhost:8002")
+
+SCENARIOS = ("login", "tour_list", "create_booking", "booking_stats")
+
+# Что считается регрессией: рост p95/p99 или падение пропускной способности больше чем на долю
+DEFAULT_TOLERANCE = 0.2
+# Рост доли ошибок (в абсолютных процентных пунктах), который считается регрессией
+ERROR_RATE_TOLERANCE = 0.01
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль с линейной интерполяцией между соседними значениями (как numpy по умолчанию)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    """Сводка по сценарию; latencies — задержки успешных запросов в секундах"""
+    total = len(latencies) + errors
+    ms = [value * 1000 for value in latencies]
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(ms) / len(ms), 2) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(max(ms), 2) if ms else 0.0,
+    }
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Список регрессий относительно baseline (сценарии, которых нет в baseline, пропускаются)"""
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if base[key] > 0 and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]} -> {result[key]}")
+        if base["throughput_rps"] > 0 and result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput_rps {base['throughput_rps']} -> {result['throughput_rps']}")
+        if result["error_rate"] > base["error_rate"] + ERROR_RATE_TOLERANCE:
+            regressions.append(f"{name}: error_rate {base['error_rate']} -> {result['error_rate']}")
+    return regressions
+
+
+async def run_scenario(send: Callable[[int], Awaitable[httpx.Response]], requests: int, concurrency: int) -> dict:
+    """Выполняет requests вызовов send(i) не более чем concurrency одновременно"""
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await send(i)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+class Benchmark:
+    """Готовит тестового пользователя и тур, затем прогоняет сценарии по HTTP"""
+
+    def __init__(self, auth_url: str, tours_url: str, booking_url: str, concurrency: int):
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        timeout = httpx.Timeout(30.0)
+        self.auth = httpx.AsyncClient(base_url=auth_url, limits=limits, timeout=timeout)
+        self.tours = httpx.AsyncClient(base_url=tours_url, limits=limits, timeout=timeout)
+        self.booking = httpx.AsyncClient(base_url=booking_url, limits=limits, timeout=timeout)
+        self.credentials = None
+        self.headers = {}
+        self.user_id = None
+        self.tour_id = None
+
+    async def setup(self):
+        suffix = uuid.uuid4().hex[:10]
+        self.credentials = {"username": f"bench_{suffix}", "password": "bench-password"}
+        response = await self.auth.post("/users", json={
+            **self.credentials,
+            "email": f"bench_{suffix}@example.com",
+            "name": "Benchmark",
+        })
+        response.raise_for_status()
+        self.user_id = response.json()["id"]
+        response = await self.auth.post("/login", json=self.credentials)
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await self.tours.get("/tours", params={"limit": 1, "available": True})
+        response.raise_for_status()
+        tours = response.json()
+        self.tour_id = tours[0]["id"] if tours else None
+
+    def login(self, i: int):
+        return self.auth.post("/login", json=self.credentials)
+
+    def tour_list(self, i: int):
+        return self.tours.get("/tours", params={"limit": 20})
+
+    def create_booking(self, i: int):
+        # Даты разнесены по году, чтобы прогон не упирался в вместимость одной даты
+        travel_date = datetime.now(timezone.utc) + timedelta(days=30 + i % 365)
+        return self.booking.post("/bookings", headers=self.headers, json={
+            "title": "Benchmark booking",
+            "user_id": self.user_id,
+            "tour_id": self.tour_id,
+            "travel_date": travel_date.isoformat(),
+            "participants_count": 1,
+        })
+
+    def booking_stats(self, i: int):
+        return self.booking.get("/bookings/stats", headers=self.headers)
+
+    async def run(self, scenarios: List[str], requests: int, concurrency: int) -> Dict[str, dict]:
+        await self.setup()
+        results = {}
+        for name in scenarios:
+            if name == "create_booking" and self.tour_id is None:
+                print(f"{name}: пропущен — в каталоге нет доступных туров")
+                continue
+            results[name] = await run_scenario(getattr(self, name), requests, concurrency)
+            print(format_result(name, results[name]))
+        return results
+
+    async def aclose(self):
+        for client in (self.auth, self.tours, self.booking):
+            await client.aclose()
+
+
+def format_result(name: str, result: dict) -> str:
+    return (
+        f"{name:<16} {result['throughput_rps']:>9.1f} rps  "
+        f"p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  "
+        f"p99 {result['p99_ms']:>8.1f} ms  errors {result['errors']}/{result['requests']}"
+    )
+
+
+async def run_benchmark(
+    auth_url: str = BASE_AUTH,
+    tours_url: str = BASE_TOURS,
+    booking_url: str = BASE_BOOKING,
+    scenarios: List[str] = SCENARIOS,
+    requests: int = 200,
+    concurrency: int = 10,
+) -> Dict[str, dict]:
+    bench = Benchmark(auth_url, tours_url, booking_url, concurrency)
+    try:
+        return await bench.run(list(scenarios), requests, concurrency)
+    finally:
+        await bench.aclose()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон auth/tours/booking сервисов")
+    parser.add_argument("--auth-url", default=BASE_AUTH)
+    parser.add_argument("--tours-url", default=BASE_TOURS)
+    parser.add_argument("--booking-url", default=BASE_BOOKING)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="через запятую: " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=10, help="одновременных запросов")
+    parser.add_argument("--output", help="куда записать результаты (JSON)")
+    parser.add_argument("--baseline", help="JSON с результатами прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="допустимое ухудшение p95/p99 и rps (доля, по умолчанию 0.2)")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(run_benchmark(
+        args.auth_url, args.tours_url, args.booking_url,
+        scenarios, args.requests, args.concurrency,
+    ))
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    failed = [name for name, result in results.items() if result["errors"] == result["requests"]]
+    for name in failed:
+        print(f"{name}: все запросы завершились ошибкой")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ {line}")
+
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
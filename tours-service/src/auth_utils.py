@@ -1,25 +1,55 @@
 # tours-service/src/auth_utils.py
 from jose import JWTError, jwt
+from datetime import datetime, timedelta
+from typing import Optional
+import hashlib
+import time
 import os
 
+from .cache import TTLCache
+
 # Секретный ключ и алгоритм читаем из окружения (должны совпадать с auth-service)
 SECRET_KEY = os.getenv("SECRET_KEY", "tourism-platform-secret-key-2024-production-ready")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+SERVICE_TOKEN_EXPIRE_MINUTES = 5
 
-# Список администраторов (должен совпадать с auth-service)
-ADMIN_USERS = ['admin', 'manager', 'root', 'boss']
+# Кэш проверенных токенов: ключ — SHA-256 токена, значение — claims до истечения exp
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "1800"))
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
 
-def verify_token(token: str):
-    """Проверяет JWT токен и возвращает username"""
+def decode_token(token: str) -> Optional[dict]:
+    """Проверяет JWT токен и возвращает его claims (с кэшированием до exp)"""
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        return username
     except JWTError:
         return None
+    exp = payload.get("exp")
+    token_cache.set(key, payload, ttl=exp - time.time() if exp is not None else None)
+    return payload
+
+def decode_user_token(token: str) -> Optional[dict]:
+    """Claims пользовательского токена; токены без uid (старые и сервисные) не принимаются"""
+    payload = decode_token(token)
+    if payload is None or payload.get("sub") is None or payload.get("uid") is None:
+        return None
+    return payload
 
-def is_admin_user(username: str) -> bool:
-    """Проверяет, является ли пользователь администратором"""
-    return username in ADMIN_USERS
+def has_role(claims: dict, role: str) -> bool:
+    return role in claims.get("roles", ())
+
+def create_service_token(service: str) -> str:
+    """Короткоживущий токен с ролью service для внутренних эндпоинтов auth-service"""
+    expire = datetime.utcnow() + timedelta(minutes=SERVICE_TOKEN_EXPIRE_MINUTES)
+    return jwt.encode({"sub": service, "roles": ["service"], "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+
+def verify_token(token: str):
+    """Проверяет JWT токен и возвращает username"""
+    payload = decode_user_token(token)
+    if payload is None:
+        return None
+    return payload.get("sub")
@@ -1,19 +1,36 @@
 # tours-service/src/main.py
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks, Query, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, func, or_, any_, literal, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from typing import List, Optional
 from datetime import datetime
+import logging
+import os
 
 # Импорты для работы в контейнере
 from .models import Tour as TourModel  # Модель из models.py
-from .schemas import TourCreate, TourUpdate, Tour as TourSchema  # Схемы из schemas.py
-from .database import SessionLocal, engine, get_db
-from . import auth_utils
+from .schemas import TourCreate, TourUpdate, Tour as TourSchema, TourFacets, DestinationFacet  # Схемы из schemas.py
+from .database import (
+    SessionLocal, engine, get_db, run_db, shutdown_db_executor,
+    db_state, refresh_db_status, start_db_monitor, stop_db_monitor,
+)
+from . import auth_utils, revocation
+from .notifications import notify_tour_changed
+from .pagination import paginate, finish_page
+from .metrics import MetricsMiddleware, ServiceCollector, register_collector, metrics_response
+from .logging_config import setup_logging, RequestIdMiddleware
+from .tracing import setup_tracing, instrument_engine, TracingMiddleware
+from .deadline import DeadlineMiddleware
 
 # Таблицы создаются в init.sql при инициализации БД
 
+setup_logging("tours-service")
+setup_tracing("tours-service")
+instrument_engine(engine)
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Tours Service",
     description="Microservice for managing tours",
@@ -22,62 +39,209 @@ app = FastAPI(
 
 security = HTTPBearer()
 
-# Функция для получения текущего пользователя из токена
-async def get_current_user(
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(TracingMiddleware)
+register_collector(ServiceCollector(
+    engine,
+    caches={"token": auth_utils.token_cache},
+    stats={"revocation": lambda: revocation.revocation_stats},
+))
+
+@app.on_event("startup")
+async def startup():
+    start_db_monitor()
+    revocation.start_revocation_poller("tours-service")
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_db_monitor()
+    await revocation.stop_revocation_poller()
+    shutdown_db_executor()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+# Claims токена (sub, uid, roles) проверяются локально: подпись, срок и список отозванных
+async def get_token_claims(
     credentials: HTTPAuthorizationCredentials = Depends(security)
-):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    username = auth_utils.verify_token(credentials.credentials)
-    if username is None:
+) -> dict:
+    claims = auth_utils.decode_user_token(credentials.credentials)
+    if claims is None or revocation.is_revoked(claims["uid"]):
         raise credentials_exception
-    
-    return username
+    return claims
+
+# Функция для получения текущего пользователя из токена
+async def get_current_user(claims: dict = Depends(get_token_claims)):
+    return claims["sub"]
 
 @app.get("/health")
 async def health_check():
-    try:
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        db_status = "connected"
-    except Exception:
-        db_status = "disconnected"
+    db_status = db_state["status"]
+    if db_status == "unknown":
+        # Монитор еще не успел отработать — проверяем один раз сами
+        db_status = await refresh_db_status()
     
     return {
         "status": "healthy" if db_status == "connected" else "unhealthy",
         "service": "tours-service",  
         "database": db_status,
+        "token_cache": auth_utils.token_cache.stats(),
+        "revocation": revocation.revocation_stats,
         "timestamp": datetime.utcnow().isoformat()
     }
 
+# Максимум id в одном пакетном запросе GET /tours?ids=
+MAX_BATCH_IDS = int(os.getenv("MAX_BATCH_IDS", "500"))
+
+def parse_ids(ids: str) -> List[int]:
+    """Разбирает список id через запятую (без повторов, с сохранением порядка)"""
+    try:
+        parsed = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if not parsed or len(parsed) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"ids must contain from 1 to {MAX_BATCH_IDS} values")
+    return parsed
+
+# Колонки, по которым можно сортировать каталог (параметр sort, "-" — по убыванию)
+SORT_COLUMNS = {
+    "id": TourModel.id,
+    "price": TourModel.price,
+    "duration_days": TourModel.duration_days,
+    "created_at": TourModel.created_at,
+}
+
+def search_query(
+    q: Optional[str] = Query(None, min_length=1, max_length=200, description="Поиск по названию, направлению и описанию"),
+) -> Optional[str]:
+    """Строка поиска q: объявлена один раз, FastAPI кэширует зависимость в пределах запроса"""
+    return q
+
+def tour_filters(
+    q: Optional[str] = Depends(search_query),
+    destination: Optional[str] = None,
+    available: Optional[bool] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    min_duration: Optional[int] = Query(None, ge=1),
+    max_duration: Optional[int] = Query(None, ge=1),
+    features: Optional[List[str]] = Query(None, description="Тур должен содержать все перечисленные особенности"),
+) -> list:
+    """Условия фильтрации каталога, общие для списка туров и фасетов"""
+    conditions = []
+    
+    # ILIKE с ведущим % использует триграммный индекс idx_tours_destination_trgm
+    if destination:
+        conditions.append(TourModel.destination.ilike(f"%{destination}%"))
+    
+    if available is not None:
+        conditions.append(TourModel.available == available)
+    
+    if q:
+        # Полнотекстовое совпадение по search_vector или нечеткое (триграммы) по названию и направлению;
+        # оба условия обслуживаются GIN-индексами
+        conditions.append(or_(
+            TourModel.search_vector.op("@@")(func.websearch_to_tsquery("simple", q)),
+            TourModel.destination.op("%")(q),
+            TourModel.title.op("%")(q),
+        ))
+    
+    if min_price is not None:
+        conditions.append(TourModel.price >= min_price)
+    if max_price is not None:
+        conditions.append(TourModel.price <= max_price)
+    if min_duration is not None:
+        conditions.append(TourModel.duration_days >= min_duration)
+    if max_duration is not None:
+        conditions.append(TourModel.duration_days <= max_duration)
+    
+    # features @> ARRAY[...] — обслуживается GIN-индексом idx_tours_features
+    if features:
+        conditions.append(TourModel.features.contains(features))
+    
+    return conditions
+
 # Get all tours
 @app.get("/tours", response_model=List[TourSchema])
 async def get_tours(
-    skip: int = 0, 
-    limit: int = 100,
-    destination: Optional[str] = None,
-    available: Optional[bool] = None,
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor"),
+    ids: Optional[str] = Query(None, description="Пакетная выборка: id через запятую, skip/limit не применяются"),
+    q: Optional[str] = Depends(search_query),
+    sort: Optional[str] = Query(None, pattern="^-?(id|price|duration_days|created_at)$",
+                                description="Сортировка, например price или -created_at; с q по умолчанию — по релевантности"),
+    conditions: list = Depends(tour_filters),
     db: Session = Depends(get_db)
 ):
-    query = db.query(TourModel)
+    query = db.query(TourModel).filter(*conditions)
     
-    if destination:
-        query = query.filter(TourModel.destination.ilike(f"%{destination}%"))
+    if ids is not None:
+        # Один запрос WHERE id = ANY(:ids) вместо N вызовов /tours/{id}
+        tour_ids = parse_ids(ids)
+        id_array = literal(tour_ids, ARRAY(Integer))
+        tours = await run_db(query.filter(TourModel.id == any_(id_array)).order_by(TourModel.id).all)
+        return tours
     
-    if available is not None:
-        query = query.filter(TourModel.available == available)
+    if q and sort is None:
+        # Результаты поиска упорядочены по релевантности, а не по ключу, поэтому только skip/limit
+        if cursor:
+            raise HTTPException(status_code=400, detail="Cursor pagination is not supported with q, use skip or sort")
+        ts_query = func.websearch_to_tsquery("simple", q)
+        rank = func.ts_rank(TourModel.search_vector, ts_query) + func.greatest(
+            func.similarity(TourModel.destination, q),
+            func.similarity(TourModel.title, q),
+        )
+        tours = await run_db(query.order_by(rank.desc(), TourModel.id).offset(skip).limit(limit).all)
+        return tours
+    
+    sort = sort or "id"
+    descending = sort.startswith("-")
+    sort_column = SORT_COLUMNS[sort.lstrip("-")]
+    if sort_column is TourModel.id:
+        sort_column = None
     
-    tours = query.offset(skip).limit(limit).all()
-    return tours
+    tours = await run_db(paginate(query, TourModel.id, cursor, skip, limit, sort_column, descending).all)
+    return finish_page(tours, limit, response, sort_column)
+
+# Facet counts: количество туров по направлениям с учетом тех же фильтров (объявлен до /tours/{tour_id})
+@app.get("/tours/facets", response_model=TourFacets)
+async def get_tour_facets(
+    conditions: list = Depends(tour_filters),
+    db: Session = Depends(get_db)
+):
+    rows = await run_db(
+        db.query(
+            TourModel.destination,
+            func.count(TourModel.id),
+            func.min(TourModel.price),
+            func.max(TourModel.price),
+        )
+        .filter(*conditions)
+        .group_by(TourModel.destination)
+        .order_by(func.count(TourModel.id).desc(), TourModel.destination)
+        .all
+    )
+    destinations = [
+        DestinationFacet(destination=destination, count=count, min_price=min_price, max_price=max_price)
+        for destination, count, min_price, max_price in rows
+    ]
+    return TourFacets(total=sum(d.count for d in destinations), destinations=destinations)
 
 # Get tour by ID
 @app.get("/tours/{tour_id}", response_model=TourSchema)
 async def get_tour(tour_id: int, db: Session = Depends(get_db)):
-    tour = db.query(TourModel).filter(TourModel.id == tour_id).first()
+    tour = await run_db(db.query(TourModel).filter(TourModel.id == tour_id).first)
     if not tour:
         raise HTTPException(status_code=404, detail="Tour not found")
     return tour
@@ -87,10 +251,11 @@ async def get_tour(tour_id: int, db: Session = Depends(get_db)):
 async def create_tour(
     tour: TourCreate, 
     current_user: str = Depends(get_current_user),
+    claims: dict = Depends(get_token_claims),
     db: Session = Depends(get_db)
 ):
-    # Проверяем права администратора
-    if not auth_utils.is_admin_user(current_user):
+    # Проверяем права администратора (роль из токена)
+    if not auth_utils.has_role(claims, "admin"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
@@ -103,12 +268,12 @@ async def create_tour(
         price=tour.price,
         duration_days=tour.duration_days,
         available=tour.available,
+        capacity=tour.capacity,
         features=tour.features
     )
     
     db.add(db_tour)
-    db.commit()
-    db.refresh(db_tour)
+    await run_db(db.commit)
     return db_tour
 
 # Update tour
@@ -116,65 +281,61 @@ async def create_tour(
 async def update_tour(
     tour_id: int, 
     tour_update: TourUpdate, 
+    background_tasks: BackgroundTasks,
     current_user: str = Depends(get_current_user),
+    claims: dict = Depends(get_token_claims),
     db: Session = Depends(get_db)
 ):
-    print(f"🔄 Обновление тура {tour_id} пользователем {current_user}")
-    
-    # Проверяем права администратора
-    if not auth_utils.is_admin_user(current_user):
-        print(f"❌ Пользователь {current_user} не является администратором")
+    # Проверяем права администратора (роль из токена)
+    if not auth_utils.has_role(claims, "admin"):
+        logger.warning("Обновление тура без прав администратора", extra={"tour_id": tour_id, "user": current_user})
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
         )
     
-    print(f"✅ Пользователь {current_user} имеет права администратора")
-    
-    db_tour = db.query(TourModel).filter(TourModel.id == tour_id).first()
+    db_tour = await run_db(db.query(TourModel).filter(TourModel.id == tour_id).first)
     if not db_tour:
-        print(f"❌ Тур {tour_id} не найден")
         raise HTTPException(status_code=404, detail="Tour not found")
     
-    print(f"✅ Тур {tour_id} найден: {db_tour.title}")
-    
     update_data = tour_update.model_dump(exclude_unset=True)
-    print(f"📝 Данные для обновления: {update_data}")
-    
     for field, value in update_data.items():
-        print(f"🔄 Обновляем поле {field}: {getattr(db_tour, field)} -> {value}")
         setattr(db_tour, field, value)
     
     try:
-        db.commit()
-        db.refresh(db_tour)
-        print(f"✅ Тур {tour_id} успешно обновлен")
+        await run_db(db.commit)
+        logger.info("Тур обновлен", extra={"tour_id": tour_id, "user": current_user, "fields": sorted(update_data)})
+        # booking-service кэширует цену тура — сбрасываем после ответа клиенту
+        background_tasks.add_task(notify_tour_changed, tour_id)
         return db_tour
     except Exception as e:
-        print(f"❌ Ошибка при обновлении тура: {e}")
-        db.rollback()
+        logger.exception("Ошибка при обновлении тура", extra={"tour_id": tour_id})
+        await run_db(db.rollback)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 # Delete tour
 @app.delete("/tours/{tour_id}")
 async def delete_tour(
     tour_id: int, 
+    background_tasks: BackgroundTasks,
     current_user: str = Depends(get_current_user),
+    claims: dict = Depends(get_token_claims),
     db: Session = Depends(get_db)
 ):
-    # Проверяем права администратора
-    if not auth_utils.is_admin_user(current_user):
+    # Проверяем права администратора (роль из токена)
+    if not auth_utils.has_role(claims, "admin"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
         )
     
-    tour = db.query(TourModel).filter(TourModel.id == tour_id).first()
+    tour = await run_db(db.query(TourModel).filter(TourModel.id == tour_id).first)
     if not tour:
         raise HTTPException(status_code=404, detail="Tour not found")
     
-    db.delete(tour)
-    db.commit()
+    await run_db(db.delete, tour)
+    await run_db(db.commit)
+    background_tasks.add_task(notify_tour_changed, tour_id)
     return {"message": "Tour deleted successfully"}
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 # tours-service/src/models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric, Text
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric, Text, Computed
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 
 # Импорт для работы в контейнере
@@ -8,6 +9,8 @@ from .database import Base
 
 class Tour(Base):
     __tablename__ = "tours"
+    # created_at/updated_at возвращаются тем же INSERT/UPDATE ... RETURNING, без refresh
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
@@ -16,6 +19,14 @@ class Tour(Base):
     price = Column(Numeric(10, 2), nullable=False)
     duration_days = Column(Integer, nullable=False)
     available = Column(Boolean, default=True)
+    capacity = Column(Integer)  # Мест на одну дату отправления; NULL — без ограничения
     features = Column(ARRAY(Text))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Генерируется в БД (см. init.sql); deferred — чтобы не тянуть tsvector в каждый SELECT
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(destination, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B')",
+        persisted=True,
+    )))
\ No newline at end of file
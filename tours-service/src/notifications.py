@@ -0,0 +1,57 @@
+# tours-service/src/notifications.py
+import asyncio
+import httpx
+import logging
+import os
+import socket
+
+from .auth_utils import create_service_token
+from .logging_config import REQUEST_ID_HEADER, request_id_var
+from .tracing import inject_context
+
+logger = logging.getLogger(__name__)
+
+# Экземпляры booking-service, которые держат кэш туров (через запятую)
+BOOKING_SERVICE_URLS = [
+    url.strip()
+    for url in os.getenv("BOOKING_SERVICE_URLS", "http://booking-service:8002").split(",")
+    if url.strip()
+]
+# Разворачивать имя в адреса всех подов (headless Service отдает IP каждого пода)
+BOOKING_SERVICE_RESOLVE_ALL = os.getenv("BOOKING_SERVICE_RESOLVE_ALL", "false").lower() == "true"
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "2"))
+
+async def _resolve_all(url: str) -> list:
+    """URL на каждый адрес из DNS-записи хоста; при ошибке резолва - исходный URL"""
+    parsed = httpx.URL(url)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parsed.host, parsed.port or 80, type=socket.SOCK_STREAM
+        )
+    except OSError as e:
+        logger.warning("Не удалось получить адреса booking-service", extra={"url": url, "error": str(e)})
+        return [url]
+    addresses = dict.fromkeys(info[4][0] for info in infos)
+    return [str(parsed.copy_with(host=address)) for address in addresses]
+
+async def _target_urls() -> list:
+    if not BOOKING_SERVICE_RESOLVE_ALL:
+        return BOOKING_SERVICE_URLS
+    resolved = await asyncio.gather(*(_resolve_all(url) for url in BOOKING_SERVICE_URLS))
+    return list(dict.fromkeys(url for urls in resolved for url in urls))
+
+async def notify_tour_changed(tour_id: int):
+    """Просит каждый экземпляр booking-service сбросить кэш тура (best effort, остальное добьет TTL кэша)"""
+    headers = inject_context({"Authorization": f"Bearer {create_service_token('tours-service')}", REQUEST_ID_HEADER: request_id_var.get()})
+    urls = await _target_urls()
+    async with httpx.AsyncClient(timeout=NOTIFY_TIMEOUT) as client:
+        results = await asyncio.gather(
+            *(client.delete(f"{url}/internal/tour-cache/{tour_id}", headers=headers)
+              for url in urls),
+            return_exceptions=True,
+        )
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            logger.warning("Не удалось сбросить кэш тура", extra={"tour_id": tour_id, "url": url, "error": str(result)})
+        elif result.status_code >= 400:
+            logger.warning("Не удалось сбросить кэш тура", extra={"tour_id": tour_id, "url": url, "status": result.status_code})
@@ -0,0 +1,60 @@
+# tours-service/src/pagination.py
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_
+import base64
+import binascii
+import json
+
+# Заголовок, в котором клиент получает курсор следующей страницы
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, binascii.Error):
+        values = None
+    if not isinstance(values, dict) or not isinstance(values.get("id"), int):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return values
+
+def paginate(query, id_column, cursor: str = None, skip: int = 0, limit: int = 100,
+             sort_column=None, descending: bool = False):
+    """Keyset-пагинация по (sort_column, id) или просто по id: с курсором — WHERE (key, id) > (:key, :id),
+    без него — прежний skip/limit. Запрашивает на одну строку больше, чтобы понять, есть ли следующая страница"""
+    keys = [id_column] if sort_column is None else [sort_column, id_column]
+    query = query.order_by(*(key.desc() if descending else key for key in keys))
+    if cursor:
+        values = decode_cursor(cursor)
+        if sort_column is None:
+            last = (values["id"],)
+        elif "key" in values:
+            last = (values["key"], values["id"])
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        position = tuple_(*keys)
+        query = query.filter(position < tuple_(*last) if descending else position > tuple_(*last))
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit + 1)
+
+def finish_page(rows: list, limit: int, response: Response, sort_column=None) -> list:
+    """Обрезает лишнюю строку и отдает курсор следующей страницы в заголовке"""
+    # Пустая страница (limit < 1 маршруты не пропускают) курсора не дает
+    if limit > 0 and len(rows) > limit:
+        rows = rows[:limit]
+        values = {"id": rows[-1].id}
+        if sort_column is not None:
+            values["key"] = getattr(rows[-1], sort_column.key)
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(values)
+    return rows
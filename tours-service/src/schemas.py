@@ -1,5 +1,5 @@
 # tours-service/src/schemas.py
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -10,6 +10,7 @@ class TourCreate(BaseModel):
     price: float
     duration_days: int
     available: bool = True
+    capacity: Optional[int] = Field(None, ge=1)
     # Use default_factory to avoid shared mutable default between instances
     features: Optional[List[str]] = None
 
@@ -20,6 +21,7 @@ class TourUpdate(BaseModel):
     price: Optional[float] = None
     duration_days: Optional[int] = None
     available: Optional[bool] = None
+    capacity: Optional[int] = Field(None, ge=1)
     features: Optional[List[str]] = None
 
 class Tour(BaseModel):
@@ -30,9 +32,20 @@ class Tour(BaseModel):
     price: float
     duration_days: int
     available: bool
+    capacity: Optional[int] = None
     features: Optional[List[str]]
     created_at: datetime
     updated_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class DestinationFacet(BaseModel):
+    destination: str
+    count: int
+    min_price: float
+    max_price: float
+
+class TourFacets(BaseModel):
+    total: int
+    destinations: List[DestinationFacet]
\ No newline at end of file
@@ -24,3 +24,116 @@ def test_get_tours_list_ok():
     assert isinstance(response.json(), list)
 
 
+def test_run_db_dispatches_to_db_executor():
+    import asyncio
+    import threading
+    from src.database import run_db
+
+    thread_name = asyncio.run(run_db(lambda: threading.current_thread().name))
+    assert thread_name.startswith("db")
+
+
+def test_get_tours_returns_next_cursor_for_full_page(fake_db):
+    from types import SimpleNamespace
+    from src.pagination import decode_cursor
+
+    fake_db.query_results = [[SimpleNamespace(
+        id=i, title=f"Tour {i}", description=None, destination="Sochi", price=100.0,
+        duration_days=3, available=True, features=None,
+        created_at="2024-01-01T00:00:00", updated_at="2024-01-01T00:00:00",
+    ) for i in (1, 2, 3)]]
+    response = client.get("/tours", params={"limit": 2})
+
+    assert response.status_code == 200
+    assert [t["id"] for t in response.json()] == [1, 2]
+    assert decode_cursor(response.headers["X-Next-Cursor"]) == {"id": 2}
+    assert client.get("/tours", params={"cursor": "garbage"}).status_code == 400
+
+
+def test_get_tours_search_by_q():
+    response = client.get("/tours", params={"q": "море"})
+    assert response.status_code == 200
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers
+    assert client.get("/tours", params={"q": "море", "cursor": "x"}).status_code == 400
+    # q объявлен один раз (в общей зависимости фильтров)
+    parameters = app.openapi()["paths"]["/tours"]["get"]["parameters"]
+    assert [p["name"] for p in parameters].count("q") == 1
+
+
+def test_get_tour_facets_and_sort_validation(fake_db):
+    fake_db.query_results = [[("Sochi", 2, 100.0, 150.0), ("Kazan", 1, 80.0, 80.0)]]
+    response = client.get("/tours/facets", params={"min_price": 50, "features": ["wifi"]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 3
+    assert body["destinations"][0] == {"destination": "Sochi", "count": 2, "min_price": 100.0, "max_price": 150.0}
+
+    assert client.get("/tours", params={"sort": "-price"}).status_code == 200
+    assert client.get("/tours", params={"sort": "title"}).status_code == 422
+
+
+def test_get_tours_batch_by_ids():
+    assert client.get("/tours", params={"ids": "3,1,3"}).status_code == 200
+    assert client.get("/tours", params={"ids": "1,abc"}).status_code == 400
+    assert client.get("/tours", params={"ids": ",".join(str(i) for i in range(501))}).status_code == 400
+
+
+def test_admin_check_uses_token_roles_and_revocation_list(monkeypatch, make_token):
+    from src import revocation
+
+    def token(**claims):
+        return {"Authorization": "Bearer " + make_token(**claims)}
+
+    tour = {"title": "T", "destination": "D", "price": 10, "duration_days": 1}
+    # Имя из бывшего списка ADMIN_USERS без роли в токене прав не дает
+    assert client.post("/tours", json=tour, headers=token(sub="admin", uid=1, roles=["user"])).status_code == 403
+    # Токены без uid (выданные до появления claims) и сервисные не принимаются
+    assert client.post("/tours", json=tour, headers=token(sub="admin", roles=["admin"])).status_code == 401
+
+    monkeypatch.setattr(revocation, "revoked_user_ids", frozenset({2}))
+    assert client.post("/tours", json=tour, headers=token(sub="boss", uid=2, roles=["user", "admin"])).status_code == 401
+
+
+def test_create_tour_keeps_capacity(fake_db, make_token):
+    from datetime import datetime
+
+    def server_defaults(tour):
+        tour.id, tour.created_at, tour.updated_at = 1, datetime.utcnow(), datetime.utcnow()
+
+    fake_db.on_flush = server_defaults
+    token = make_token("admin", 1, roles=["user", "admin"])
+    tour = {"title": "T", "destination": "D", "price": 10, "duration_days": 1, "capacity": 12}
+    response = client.post("/tours", json=tour, headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 201
+    assert response.json()["capacity"] == 12
+    # NULL означал бы неограниченное число мест
+    assert fake_db.added[0].capacity == 12
+
+
+def test_notify_resolves_headless_service_to_every_pod(monkeypatch):
+    import asyncio
+    import socket
+    from src import notifications
+
+    def fake_getaddrinfo(host, port, *args, **kwargs):
+        assert host == "booking-headless"
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (ip, port)) for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.1")]
+
+    monkeypatch.setattr(socket, "getaddrinfo", fake_getaddrinfo)
+    monkeypatch.setattr(notifications, "BOOKING_SERVICE_URLS", ["http://booking-headless:8002"])
+    monkeypatch.setattr(notifications, "BOOKING_SERVICE_RESOLVE_ALL", True)
+
+    urls = asyncio.run(notifications._target_urls())
+    assert urls == ["http://10.0.0.1:8002", "http://10.0.0.2:8002"]
+
+
+def test_paginated_routes_reject_out_of_range_limit():
+    from fastapi import Response
+    from src.pagination import finish_page
+
+    for params in ({"limit": 0}, {"limit": -1}, {"limit": 101}, {"skip": -1}):
+        assert client.get("/tours", params=params).status_code == 422
+    assert finish_page([], 0, Response()) == []